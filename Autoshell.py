@@ -2,18 +2,62 @@
 # Imports
 #-------------------------------------------------------
 
-from openai import OpenAI
+import time
+# the startup timing report measures from here, before anything else is imported
+IMPORT_START = time.perf_counter()
+
+import abc
+import argparse
+import asyncio
+import atexit
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import gzip
+import hashlib
+import importlib
+import io
+import json
 import os
-import pyaudio
-from pygame import mixer
+import queue
+import re
+import shutil
+import signal
+import sys
 import subprocess
 import threading
-import tiktoken
-import time
 import tkinter as tk
 from tkinter import ttk
 import wave
 
+
+class LazyModule:
+    """Stands in for a heavy module and imports it on first attribute access,
+    so that openai, pyaudio, pygame and tiktoken don't slow down the start of the window."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+openai = LazyModule("openai")
+pyaudio = LazyModule("pyaudio")
+mixer = LazyModule("pygame.mixer")
+tiktoken = LazyModule("tiktoken")
+np = LazyModule("numpy")
+
+IMPORT_DONE = time.perf_counter()
+
 #-------------------------------------------------------
 # Constants and Global Variables
 #-------------------------------------------------------
@@ -24,16 +68,50 @@ TEXT_COLOR_SETTINGS = "light_blue"
 TEXT_COLOR_POWER_SHELL = "red"
 TEXT_COLOR_AI = "white"
 TEXT_COLOR_AI_PROPOSAL = "green"
+STREAM_FLUSH_INTERVAL_MS = 30 # how often streamed deltas are pushed into the text field
+TYPEWRITER_FRAME_MS = 16 # the typewriter inserts one chunk of text per frame
+TYPEWRITER_MAX_DURATION = 2.0 # seconds, long answers are typed faster to finish within this time
+TYPEWRITER_INSTANT = False # show answers at once instead of typing them out
+SCROLLBACK_MAX_LINES = 2000 # lines kept in each text widget, older ones are archived to disk
+SCROLLBACK_CHUNK_LINES = 500 # lines archived or loaded back at once
+LOG_FLUSH_INTERVAL_MS = 50 # the debug and shell panels are updated at most once per interval
+LOG_FRAME_BUDGET = 200 # log entries written per update, older ones beyond that are skipped
 
 # Sound Stuff
 SOUND_CHUNK = 1024
 SOUND_CHANNELS = 1
-SOUND_SAMPLE_RATE = 44100
+SOUND_SAMPLE_RATE = 16000 # speech-to-text works at 16 kHz, recording more only makes the upload bigger
+SOUND_FALLBACK_SAMPLE_RATE = 44100 # used if the microphone refuses 16 kHz, the audio is resampled before the upload
+SOUND_MAX_RECORD_SECONDS = 120 # recordings stop at this length, their buffer is allocated for it up front
+SOUND_PLAYBACK_POLL = 0.02 # seconds between checks whether the mixer channel is still playing
 TTS_MODEL = "tts-1"
+TTS_SAMPLE_RATE = 24000 # the speech api sends "pcm" as 24 kHz, 16 bit, mono
+TTS_STREAM_CHUNK = 4096 # bytes of speech handed to the audio output at once
+TTS_CACHE_MAX_BYTES = 50 * 1024 * 1024 # size of cache/tts, least recently used audio is deleted above
+TTS_CACHE_MAX_TEXT = 300 # only replies up to this many characters are cached, longer ones rarely come again
+TTS_SEED_FILE = "tts_seed_phrases.txt" # phrases in files/ that are synthesised into the cache at startup
 SPEECH_TO_TEXT_MODEL = "whisper-1"
+VAD_AUTO_STOP = True # stop recording by itself once the user stopped speaking (sidebar toggle)
+VAD_SILENCE_SECONDS = 1.2 # trailing silence that ends a recording in auto-stop mode
+VAD_MIN_SPEECH_SECONDS = 0.3 # speech needed before auto-stop is armed, so a slow start isn't cut off
+VAD_FRAME_MS = 20 # length of the frames the loudness is measured on when trimming
+VAD_MIN_RMS = 300 # loudness (rms of 16 bit samples) below which audio always counts as silence
+VAD_NOISE_FACTOR = 3.0 # speech is at least this many times louder than the background noise
+VAD_TRIM_PADDING = 0.2 # seconds kept before and after the speech when silent edges are trimmed
+STT_SEGMENT_PAUSE = 0.5 # a pause this long ends a segment, which is transcribed while recording goes on
+STT_SEGMENT_MIN_SECONDS = 4.0 # segments are at least this long, speech-to-text is less accurate on snippets
+STT_SEGMENT_WORKERS = 2 # segments transcribed at the same time
 
 # Shell Stuff
 MAX_TOKENS_SHELL_ANSWER = 1000
+SHELL_ANSWER_HEAD_RATIO = 0.4 # share of MAX_TOKENS_SHELL_ANSWER for the start of long outputs, the rest keeps the end
+SHELL_COMMAND_TIMEOUT = 120 # seconds a command may run before it is interrupted
+SHELL_INTERRUPT_GRACE = 5 # seconds an interrupted command gets to stop before PowerShell is restarted
+SHELL_POOL_SIZE = 3 # PowerShell sessions, the first one is the primary session that keeps folder and variables
+SHELL_STREAM_INTERVAL = 0.1 # seconds between two batches of live output in the PowerShell panel
+KNOWN_COMMANDS_FILE = "known_commands.txt" # cached output of Get-Command, lives in the cache folder
+KNOWN_COMMANDS_MAX_AGE = 7 * 24 * 3600 # seconds until the cached command names are queried again (new modules or programs)
+POWERSHELL_PATH_FILE = "powershell_path.txt" # cached location of powershell.exe, lives in the cache folder
 
 # OpenAI Stuff
 OPEN_AI_API_KEY_ENV_VARIABLE = "OPENAI_API_KEY"
@@ -43,12 +121,54 @@ MODEL_MAX_TOKENS = 1000
 MODEL_TOP_P = 1
 MODEL_FREQUENCY_PENALTY = 0
 MODEL_PRESENCE_PENALTY = 0
+MODEL_STREAM_RESPONSE = True # render the reply token-by-token while it is generated
 LARGE_LANGUAGE_MODEL_FOR_FORWARDING_DECISION = "gpt-5.4-nano" # "gpt-3.5-turbo", "gpt-realtime"
 FORWARDING_MODEL_TEMPERATURE = 1 # 0.5 with gpt-3.5-turbo
 FORWARDING_MODEL_MAX_TOKENS = 5
 FORWARDING_MODEL_TOP_P = 1
 FORWARDING_MODEL_FREQUENCY_PENALTY = 0
 FORWARDING_MODEL_PRESENCE_PENALTY = 0
+FORWARDING_CLASSIFIER_THRESHOLD = 0.85 # below this confidence the local classifier asks the forwarding model
+FORWARDING_CACHE_SIZE = 256 # number of remembered forwarding decisions
+DEFAULT_TOKEN_ENCODING = "o200k_base" # used for models that tiktoken does not know (yet)
+MODEL_CONTEXT_WINDOWS = { # context window of the selectable models in tokens
+    "gpt-5.4-nano": 400000,
+    "gpt-5-mini": 400000,
+    "gpt-4.1-mini": 1047576,
+    "gpt-4.1-nano": 1047576,
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "gpt-3.5-turbo-16k": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 16384 # for models that are not listed above
+CONTEXT_TOKEN_BUDGET = 16384 # prompts are kept below this even if the model allows more (speed and cost)
+CONTEXT_COMPACT_AT = 0.85 # share of the budget at which the history gets compacted
+CONTEXT_KEEP_RECENT = 6 # number of most recent messages that are never compacted
+CONTEXT_ELIDE_MIN_TOKENS = 60 # shell outputs smaller than this are kept as they are
+BATCH_CONCURRENCY = 4 # batch mode: conversations that talk to the api at the same time
+BATCH_MAX_STEPS = 5 # batch mode: model replies per conversation before it is given up
+RESPONSE_MODE = "structured" # "structured": one call returns target + content, "forwarder": a second call classifies the reply
+STRUCTURED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "autoshell_reply",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "target": {"type": "string", "enum": ["user", "shell", "empty"]},
+                "content": {"type": "string"}
+            },
+            "required": ["target", "content"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Log Stuff
+JOURNAL_MAX_BYTES = 5 * 1024 * 1024 # session journals above this size are rotated and compressed
+TRACE_MAX_EVENTS = 100000 # spans kept for the chrome trace export (logs/trace_*.json)
+TRACE_STATS_WINDOW = 200 # most recent samples per stage used for the latency percentiles
 
 
 #-------------------------------------------------------
@@ -339,14 +459,343 @@ class RoundedButton(tk.Canvas):
         return super().bind(sequence, func, add)
 
 
+#-------------------------------------------------------
+# Bounded scrollback for text widgets
+#-------------------------------------------------------
+
+class Scrollback:
+    """Keeps a Text widget below max_lines. The oldest lines are moved, with their tags, into an
+    archive file that works as a stack of chunks, and are loaded back chunk by chunk when the user
+    scrolls to the top. Trimming is skipped while the user is scrolled up, and it never reaches
+    into a block that is still being written (marks listed in protected_marks)."""
+
+    def __init__(self, text, scrollbar, archive_file, max_lines=SCROLLBACK_MAX_LINES,
+                 chunk_lines=SCROLLBACK_CHUNK_LINES, protected_marks=()):
+        self.text = text
+        self.scrollbar = scrollbar
+        self.archive_file = archive_file
+        self.max_lines = max_lines
+        self.chunk_lines = chunk_lines
+        self.protected_marks = protected_marks
+        # byte offset of every archived chunk, the last one is the newest
+        self._offsets = []
+        self._reload_scheduled = False
+        os.makedirs(os.path.dirname(archive_file), exist_ok=True)
+        open(archive_file, "w", encoding="utf-8").close()
+        self.text.config(yscrollcommand=self._on_scroll)
+
+    def line_count(self):
+        return int(self.text.index("end-1c").split(".")[0])
+
+    def trim(self):
+        """Archive the oldest lines if the widget is above max_lines + chunk_lines."""
+        lines = self.line_count()
+        if lines <= self.max_lines + self.chunk_lines or self.text.yview()[1] < 1.0:
+            return
+        cut_line = lines - self.max_lines + 1
+        marks = self.text.mark_names()
+        for mark in self.protected_marks:
+            if mark in marks:
+                cut_line = min(cut_line, int(self.text.index(mark).split(".")[0]))
+        # archive in chunks, so scrolling back loads them in reasonable steps
+        start_line = 1
+        while start_line < cut_line:
+            end_line = min(start_line + self.chunk_lines, cut_line)
+            self._archive(f"{start_line}.0", f"{end_line}.0")
+            start_line = end_line
+        if cut_line > 1:
+            state = self.text.cget("state")
+            self.text.config(state="normal")
+            self.text.delete("1.0", f"{cut_line}.0")
+            self.text.config(state=state)
+
+    def clear(self):
+        """Drop the archive, e.g. when the widget content is cleared."""
+        open(self.archive_file, "w", encoding="utf-8").close()
+        self._offsets = []
+
+    def _archive(self, start, end):
+        segments = self._dump(start, end)
+        with open(self.archive_file, "a", encoding="utf-8") as file:
+            self._offsets.append(file.tell())
+            file.write(json.dumps(segments) + "\n")
+
+    def _dump(self, start, end):
+        """Return the text between start and end as [text, [tags]] segments."""
+        segments = []
+        # dump only reports toggles inside the range, tags running into it from before are active already
+        tags = [tag for tag in self.text.tag_names(start) if tag != "sel"]
+        for key, value, _ in self.text.dump(start, end, text=True, tag=True):
+            if key == "tagon" and value != "sel" and value not in tags:
+                tags.append(value)
+            elif key == "tagoff" and value in tags:
+                tags.remove(value)
+            elif key == "text":
+                if segments and segments[-1][1] == tags:
+                    segments[-1][0] += value
+                else:
+                    segments.append([value, list(tags)])
+        return segments
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(first) <= 0.0 and self._offsets and not self._reload_scheduled:
+            # not from within the scroll callback, the insert would scroll again
+            self._reload_scheduled = True
+            self.text.after_idle(self._reload)
+
+    def _reload(self):
+        """Load the newest archived chunk back in at the top, keeping the view where it is."""
+        self._reload_scheduled = False
+        if not self._offsets:
+            return
+        offset = self._offsets.pop()
+        with open(self.archive_file, "r+", encoding="utf-8") as file:
+            file.seek(offset)
+            segments = json.loads(file.readline())
+            file.seek(offset)
+            file.truncate()
+        arguments = []
+        for segment_text, segment_tags in segments:
+            arguments += [segment_text, tuple(segment_tags)]
+        state = self.text.cget("state")
+        self.text.config(state="normal")
+        self.text.insert("1.0", *arguments)
+        self.text.config(state=state)
+        loaded_lines = sum(segment_text.count("\n") for segment_text, _ in segments)
+        self.text.yview(f"{loaded_lines + 1}.0")
+
+#-------------------------------------------------------
+# Rate-limited log sink for the log panels
+#-------------------------------------------------------
+
+class LogSink:
+    """Collects log text from any thread and hands it to write on the main thread, at most once
+    per interval_ms and in one piece. If more than budget entries arrive within one frame, only
+    the newest budget entries are written together with a line that counts the skipped ones, so
+    a noisy background thread can't flood the Tk event queue."""
+
+    def __init__(self, root, write, interval_ms=LOG_FLUSH_INTERVAL_MS, budget=LOG_FRAME_BUDGET):
+        self.root = root
+        self.write = write
+        self.interval_ms = interval_ms
+        self.budget = budget
+        self.skipped_total = 0
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._flush_scheduled = False
+
+    def put(self, text):
+        """Thread-safe: queue text for the next frame."""
+        with self._lock:
+            self._pending.append(text)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self.root.after(self.interval_ms, self._flush)
+
+    def clear(self):
+        """Drop everything that has not been written yet."""
+        with self._lock:
+            self._pending.clear()
+
+    def _flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = collections.deque()
+            self._flush_scheduled = False
+        if not pending:
+            return
+        skipped = len(pending) - self.budget
+        if skipped > 0:
+            self.skipped_total += skipped
+            for _ in range(skipped):
+                pending.popleft()
+            pending.appendleft(f"[... {skipped} log entries skipped ...]\n")
+        self.write("".join(pending))
+
+#-------------------------------------------------------
+# User interface adapters
+#-------------------------------------------------------
+
+class UiAdapter(abc.ABC):
+    """Everything the pipeline needs from a user interface. GuiHandler is the Tk window and
+    TerminalUi the headless console, main hands the active one to the pipeline and the handlers.
+    All methods can be called from any thread."""
+
+    def __init__(self):
+        self.selected_model = LARGE_LANGUAGE_MODEL
+
+        # create two paths, the main path and the subdirectory path for files
+        self.main_path = os.getcwd()
+        self.files_path = os.path.join(self.main_path, "files")
+        self.log_path = os.path.join(self.main_path, "logs")
+        self.cache_path = os.path.join(self.main_path, "cache")
+
+        # set to stop the sound that is playing right now (see play_sound)
+        self._playback_lock = threading.Lock()
+        self._playback_stop = None
+
+    @abc.abstractmethod
+    def print_text(self, text, color):
+        """Append text to the conversation."""
+
+    def print_text_typewriter(self, text, color, delay=15, on_complete=None, instant=None):
+        self.print_text(text, color)
+        if on_complete:
+            on_complete()
+
+    def begin_stream(self, header, color):
+        self.print_text(header, color)
+
+    def stream_delta(self, delta):
+        self.print_text(delta, TEXT_COLOR_AI)
+
+    def end_stream(self, text=None, color=None, on_complete=None):
+        # the streamed text stays as it is, only a window can replace it
+        self.print_text("\n\n", TEXT_COLOR_AI)
+        if on_complete:
+            on_complete()
+
+    def debug_log(self, message):
+        pass
+
+    def shell_log(self, message):
+        pass
+
+    def set_status(self, name, state):
+        pass
+
+    @abc.abstractmethod
+    def confirm_execution(self, commands, streamed):
+        """Show the proposed commands and return True if the user lets them through."""
+
+    def begin_playback(self):
+        """Stop the sound that is playing and return the stop event of the next one."""
+        stop = threading.Event()
+        with self._playback_lock:
+            if self._playback_stop is not None:
+                self._playback_stop.set()
+                if startup_handler.is_ready("Audio"):
+                    mixer.stop()
+            self._playback_stop = stop
+        return stop
+
+    def end_playback(self, stop):
+        with self._playback_lock:
+            if self._playback_stop is stop:
+                self._playback_stop = None
+
+    def play_sound(self, file_name):
+        """Play a file of the files folder and return once it has finished or a newer sound replaced it.
+        Blocks, so it must not be called on the Tk main thread."""
+        startup_handler.wait("Audio")
+        self.debug_log("Playing audio...")
+        with tracer.span("playback") as span:
+            # the sound is decoded into memory, so the file can be overwritten while it plays
+            sound = mixer.Sound(os.path.join(self.files_path, file_name))
+            stop = self.begin_playback()
+            channel = sound.play()
+            # the channel knows when the sound is really over, a newer sound stops the wait right away
+            while channel is not None and channel.get_busy() and not stop.wait(SOUND_PLAYBACK_POLL):
+                pass
+            self.end_playback(stop)
+        self.debug_log(f"Audio playback done ({span.duration:.2f}s)")
+
+    def play_stream(self, chunks, sample_rate):
+        """Play 16 bit mono PCM while its chunks arrive and return once it has finished or a newer
+        sound replaced it. Blocks, so it must not be called on the Tk main thread."""
+        stop = self.begin_playback()
+        audio = pyaudio.PyAudio()
+        stream = None
+        try:
+            # opened before the first chunk arrives, so it doesn't add to the time to first audio
+            stream = audio.open(format=pyaudio.paInt16, channels=1, rate=sample_rate, output=True)
+            rest = b""
+            for chunk in chunks:
+                if stop.is_set():
+                    break
+                # only whole samples can be written
+                data = rest + chunk
+                usable = len(data) - len(data) % 2
+                data, rest = data[:usable], data[usable:]
+                if data:
+                    stream.write(data)
+            if not stop.is_set():
+                # returns once everything that was written has been played
+                stream.stop_stream()
+        finally:
+            if stream is not None:
+                stream.close()
+            audio.terminate()
+            self.end_playback(stop)
+
+    @abc.abstractmethod
+    def start(self):
+        """Take requests until the user quits."""
+
+
+class TerminalUi(UiAdapter):
+    """Headless front end: requests are read from stdin and answers are written to stdout, debug
+    and PowerShell panel output goes to stderr if verbose is set."""
+
+    def __init__(self, verbose=False, output=None):
+        super().__init__()
+        self.verbose = verbose
+        # batch mode writes its results to stdout, the conversation text goes to stderr then
+        self.output = output or sys.stdout
+        self._lock = threading.Lock()
+
+    def print_text(self, text, color):
+        with self._lock:
+            self.output.write(text)
+            self.output.flush()
+
+    def debug_log(self, message):
+        if self.verbose:
+            with self._lock:
+                sys.stderr.write(f"[{time.strftime('%H:%M:%S')}] {message}\n")
+
+    def shell_log(self, message):
+        if self.verbose:
+            with self._lock:
+                sys.stderr.write(message)
+
+    def set_status(self, name, state):
+        self.debug_log(f"{name}: {state}")
+
+    def confirm_execution(self, commands, streamed):
+        PromptHandler.show_ai_message(f"AI PROPOSAL: \n{commands}\n\n", TEXT_COLOR_AI_PROPOSAL, streamed, self)
+        try:
+            answer = input("SYSTEM INFO: \nLet through? (y/n): ")
+        except EOFError:
+            answer = "n"
+        self.print_text("\n", TEXT_COLOR_SETTINGS)
+        # like in the window, enter alone lets the commands through
+        return answer.strip().lower() in ("y", "yes", "")
+
+    def start(self):
+        self.print_text("Autoshell (headless), type 'exit' to quit.\n\n", TEXT_COLOR_SETTINGS)
+        while True:
+            try:
+                user_input = input("USER: \n").strip()
+            except (EOFError, KeyboardInterrupt):
+                break
+            if user_input in ("exit", "quit"):
+                break
+            if not user_input:
+                continue
+            self.print_text("\n", TEXT_COLOR_USER)
+            pipeline.new_request()
+            pipeline.run(user_input, echo_input=False)
+
 #-------------------------------------------------------
 # Guided User Interface
 #-------------------------------------------------------
 
-class GuiHandler:
+class GuiHandler(UiAdapter):
     def __init__(self):
-        # Initialize the mixer module for playing sound
-        mixer.init()
+        super().__init__()
 
         # Color palette
         self.colors = {
@@ -406,15 +855,38 @@ class GuiHandler:
         self.create_text_window()
         self.create_bottom_panels()
 
+        # log text from all threads is written to the panels once per frame
+        self.shell_sink = LogSink(self.root, self._shell_log_impl)
+        self.debug_sink = LogSink(self.root, self._debug_log_impl)
+
         # Keyboard input mode variables
         self.keyboard_input_mode = False
         self.keyboard_input_buffer = ""
         self.last_was_system_info = False
 
-        # create two paths, the main path and the subdirectory path for files
-        self.main_path = os.getcwd()
-        self.files_path = os.path.join(self.main_path, "files")
-        self.log_path = os.path.join(self.main_path, "logs")
+        # Streaming output state (see begin_stream)
+        self._stream_lock = threading.Lock()
+        self._stream_pending = []
+        self._stream_flush_scheduled = False
+        self._stream_color = TEXT_COLOR_AI
+
+        # Typewriter state (see print_text_typewriter)
+        self._typewriter_text = None
+        self._typewriter_pos = 0
+        self._typewriter_color = TEXT_COLOR_AI
+        self._typewriter_on_complete = None
+        self._typewriter_deadline = 0
+        self._typewriter_generation = 0
+
+        # bounded scrollback, older lines are archived and come back when scrolling to the top
+        scrollback_path = os.path.join(self.cache_path, "scrollback")
+        self.text_scrollback = Scrollback(
+            self.text_field, self.text_scrollbar, os.path.join(scrollback_path, "conversation.jsonl"),
+            protected_marks=("stream_start", "keyboard_line_start"))
+        self.shell_scrollback = Scrollback(
+            self.shell_text, self.shell_scrollbar, os.path.join(scrollback_path, "shell.jsonl"))
+        self.debug_scrollback = Scrollback(
+            self.debug_text, self.debug_scrollbar, os.path.join(scrollback_path, "debug.jsonl"))
 
         # bind the key listening function to the gui
         self.root.bind("<Key>", self.key_pressed)
@@ -462,19 +934,6 @@ class GuiHandler:
 
         # (Scrollbar uses custom ModernScrollbar canvas widget instead of ttk)
 
-    def play_sound(self, file_name):
-        self.debug_log("Playing audio...")
-        t = time.time()
-        full_path = os.path.join(self.files_path, file_name)
-        dummy_path = os.path.join(self.files_path, "audio_dummy.wav")
-        mixer.music.load(full_path)
-        mixer.music.play()
-        while mixer.music.get_busy():
-            time.sleep(0.1)
-        # load a dummy file so that the "generated_audio.mp3" can be overwritten and be used again
-        mixer.music.load(dummy_path)
-        self.debug_log(f"Audio playback done ({time.time()-t:.2f}s)")
-    
     def print_text(self, text, color):
         # If called from a background thread, reschedule on the main thread
         if threading.current_thread() is not threading.main_thread():
@@ -518,16 +977,23 @@ class GuiHandler:
         # Keep text field editable during keyboard input, otherwise disable it
         if not self.keyboard_input_mode:
             self.text_field.config(state="disabled")
+        self.text_scrollback.trim()
 
-    def print_text_typewriter(self, text, color, delay=15, on_complete=None):
-        """Print text character-by-character with a typewriter effect.
-        The header (e.g. 'AI TO USER: \\n') appears instantly; the body is typed out.
+    def print_text_typewriter(self, text, color, delay=15, on_complete=None, instant=None):
+        """Print text with a typewriter effect.
+        The header (e.g. 'AI TO USER: \\n') appears instantly; the body is typed out in chunks once
+        per frame, paced to delay ms per character but never longer than TYPEWRITER_MAX_DURATION.
+        With instant (default TYPEWRITER_INSTANT) the body is inserted at once.
         on_complete is called when the typewriter finishes.
         Can be called from any thread — schedules itself on the main thread."""
         if threading.current_thread() is not threading.main_thread():
-            self.root.after(0, self.print_text_typewriter, text, color, delay, on_complete)
+            self.root.after(0, self.print_text_typewriter, text, color, delay, on_complete, instant)
             return
 
+        # a still running typewriter is finished first, so messages never interleave
+        if self._typewriter_text is not None:
+            self._typewriter_finish()
+
         # Split into header + body at the first newline
         newline_pos = text.find("\n")
         if newline_pos != -1:
@@ -541,37 +1007,132 @@ class GuiHandler:
         if header:
             self.text_field.config(state="normal")
             self.text_field.insert(tk.END, header, f"tag_{color}")
-            self.text_field.update_idletasks()
             self.text_field.see(tk.END)
 
         # Typewriter output is not a SYSTEM INFO message, so reset the merge flag
         self.last_was_system_info = False
 
-        # Type out the body character by character
-        self._typewriter_queue = list(body)
+        # Type out the body from a cursor into the text, one chunk per frame
+        self._typewriter_text = body
+        self._typewriter_pos = 0
         self._typewriter_color = color
-        self._typewriter_delay = delay
         self._typewriter_on_complete = on_complete
-        self._typewriter_tick()
-
-    def _typewriter_tick(self):
-        """Insert one character from the typewriter queue, then schedule the next."""
-        if not self._typewriter_queue:
-            # Done — disable editing
-            if not self.keyboard_input_mode:
-                self.text_field.config(state="disabled")
-            if self._typewriter_on_complete:
-                self._typewriter_on_complete()
-                self._typewriter_on_complete = None
+        self._typewriter_generation += 1
+        if instant is None:
+            instant = TYPEWRITER_INSTANT
+        if instant:
+            self._typewriter_finish()
+            return
+        duration = min(len(body) * delay / 1000, TYPEWRITER_MAX_DURATION)
+        self._typewriter_deadline = time.perf_counter() + duration
+        self._typewriter_tick(self._typewriter_generation)
+
+    def _typewriter_tick(self, generation):
+        """Insert the next chunk of the typewriter text, then schedule the next frame."""
+        if generation != self._typewriter_generation or self._typewriter_text is None:
+            # finished early by instant mode or a newer message
+            return
+        remaining = len(self._typewriter_text) - self._typewriter_pos
+        if remaining <= 0:
+            self._typewriter_finish()
             return
 
-        char = self._typewriter_queue.pop(0)
+        # spread the remaining characters evenly over the frames left until the deadline
+        frames_left = (self._typewriter_deadline - time.perf_counter()) * 1000 / TYPEWRITER_FRAME_MS
+        chunk = remaining if frames_left <= 1 else -(-remaining // int(frames_left))
+        end = self._typewriter_pos + chunk
         self.text_field.config(state="normal")
-        self.text_field.insert(tk.END, char, f"tag_{self._typewriter_color}")
+        self.text_field.insert(tk.END, self._typewriter_text[self._typewriter_pos:end], f"tag_{self._typewriter_color}")
         self.text_field.see(tk.END)
-        self.text_field.update_idletasks()
+        self._typewriter_pos = end
+
+        self.root.after(TYPEWRITER_FRAME_MS, self._typewriter_tick, generation)
 
-        self.root.after(self._typewriter_delay, self._typewriter_tick)
+    def _typewriter_finish(self):
+        """Insert whatever is left of the typewriter text and call its on_complete."""
+        rest = self._typewriter_text[self._typewriter_pos:]
+        if rest:
+            self.text_field.config(state="normal")
+            self.text_field.insert(tk.END, rest, f"tag_{self._typewriter_color}")
+            self.text_field.see(tk.END)
+        self._typewriter_text = None
+        on_complete = self._typewriter_on_complete
+        self._typewriter_on_complete = None
+        # Done — disable editing
+        if not self.keyboard_input_mode:
+            self.text_field.config(state="disabled")
+        self.text_scrollback.trim()
+        if on_complete:
+            on_complete()
+
+    def begin_stream(self, header, color):
+        """Open a live block at the end of the text field that streamed deltas are appended to.
+        Can be called from any thread — schedules itself on the main thread."""
+        with self._stream_lock:
+            self._stream_pending = []
+            self._stream_flush_scheduled = False
+        self.root.after(0, self._begin_stream_impl, header, color)
+
+    def _begin_stream_impl(self, header, color):
+        self.text_field.config(state="normal")
+        # stream_start marks the beginning of the block, stream_end the insert position for deltas
+        self.text_field.mark_set("stream_start", "end-1c")
+        self.text_field.mark_gravity("stream_start", "left")
+        self.text_field.insert(tk.END, header, f"tag_{color}")
+        self.text_field.mark_set("stream_end", "end-1c")
+        self.text_field.mark_gravity("stream_end", "left")
+        self.text_field.see(tk.END)
+        self._stream_color = color
+        self.last_was_system_info = False
+
+    def stream_delta(self, delta):
+        """Thread-safe: queue a piece of streamed text, flushed to the text field in batches."""
+        with self._stream_lock:
+            self._stream_pending.append(delta)
+            if self._stream_flush_scheduled:
+                return
+            self._stream_flush_scheduled = True
+        self.root.after(STREAM_FLUSH_INTERVAL_MS, self._flush_stream)
+
+    def _flush_stream(self):
+        with self._stream_lock:
+            pending = "".join(self._stream_pending)
+            self._stream_pending = []
+            self._stream_flush_scheduled = False
+        if not pending or "stream_end" not in self.text_field.mark_names():
+            return
+        self.text_field.config(state="normal")
+        position = self.text_field.index("stream_end")
+        self.text_field.insert("stream_end", pending, f"tag_{self._stream_color}")
+        self.text_field.mark_set("stream_end", f"{position}+{len(pending)}c")
+        self.text_field.see(tk.END)
+        if not self.keyboard_input_mode:
+            self.text_field.config(state="disabled")
+
+    def end_stream(self, text=None, color=None, on_complete=None):
+        """Close the live block. If text is given, the streamed block is replaced by it
+        (e.g. with the final header once the forwarding decision is known), otherwise the
+        streamed text is kept as it is. on_complete is called afterwards, like for the typewriter.
+        Can be called from any thread — schedules itself on the main thread."""
+        self.root.after(0, self._end_stream_impl, text, color, on_complete)
+
+    def _end_stream_impl(self, text, color, on_complete):
+        # push out whatever is still pending before touching the block
+        self._flush_stream()
+        self.text_field.config(state="normal")
+        if "stream_start" in self.text_field.mark_names():
+            if text is None:
+                self.text_field.insert("stream_end", "\n\n", f"tag_{self._stream_color}")
+            else:
+                self.text_field.delete("stream_start", "stream_end")
+                self.text_field.insert("stream_start", text, f"tag_{color}")
+            self.text_field.mark_unset("stream_start", "stream_end")
+        self.text_field.see(tk.END)
+        if not self.keyboard_input_mode:
+            self.text_field.config(state="disabled")
+        self.text_scrollback.trim()
+        if on_complete:
+            on_complete()
 
     def toggle_record(self):
         # Toggle the recording state (microphone mode)
@@ -589,20 +1150,23 @@ class GuiHandler:
             self.record_state = 'start'
 
     def start_record(self):
-        # Start recording
-        return sound_handler.start_recording("audio_record")
+        # Start recording, the sound handler may end it by itself on silence
+        sound_handler.on_auto_stop = lambda generation: self.root.after(0, self._auto_stop_record, generation)
+        return sound_handler.start_recording()
+
+    def _auto_stop_record(self, generation):
+        # Only stop the recording that detected the silence, not one the user started since
+        if self.record_state == 'stop' and generation == sound_handler.generation:
+            self.toggle_record()
     
     def stop_record(self):
         # Stop recording
-        sound_handler.stop_recording()
-
-        # if follow up questions are enabled, then do not reset the chat history
-        if not prompt_handler.follow_up_questions:
-            prompt_handler.chat_history = PromptHandler.reset_chat_history()
+        recording = sound_handler.stop_recording()
+        pipeline.new_request()
 
         # Disable button and run pipeline on background thread
         self.record_button.config(state="disabled")
-        threading.Thread(target=self._run_pipeline, kwargs={"from_speech": True}, daemon=True).start()
+        threading.Thread(target=self._run_pipeline, kwargs={"recording": recording}, daemon=True).start()
 
     def start_keyboard_input(self):
         """Start keyboard input mode - allows user to type their message"""
@@ -642,10 +1206,7 @@ class GuiHandler:
         # If not in keyboard input mode but listen_to_keys is active (for y/n prompts), use the original handler
         if not self.keyboard_input_mode:
             if prompt_handler.listen_to_keys:
-                character = event.char
-                gui_handler.print_text(f"USER: {character}\n\n", TEXT_COLOR_USER)
-                prompt_handler.pressed_key = character
-                prompt_handler.key_is_caught = True
+                self.hand_over_key(event.char)
             return
         
         # Handle Enter key to submit input
@@ -699,14 +1260,12 @@ class GuiHandler:
         self.root.focus_set()
 
         if not user_input:
-            gui_handler.print_text("SYSTEM INFO: \nEmpty input, please try again.\n\n", TEXT_COLOR_SETTINGS)
+            self.print_text("SYSTEM INFO: \nEmpty input, please try again.\n\n", TEXT_COLOR_SETTINGS)
             # Re-enter typing mode immediately
             self.start_keyboard_input()
             return
 
-        # if follow up questions are enabled, then do not reset the chat history
-        if not prompt_handler.follow_up_questions:
-            prompt_handler.chat_history = PromptHandler.reset_chat_history()
+        pipeline.new_request()
 
         # Disable button and run pipeline on background thread
         self.record_button.config(state="disabled")
@@ -716,34 +1275,42 @@ class GuiHandler:
         # Toggle the execution mode
         if self.toggle_state.get() == 1:
             prompt_handler.ask_for_execution = False
-            gui_handler.print_text("SYSTEM INFO: \nDirect Code Execution Enabled\n\n", TEXT_COLOR_SETTINGS)
+            self.print_text("SYSTEM INFO: \nDirect Code Execution Enabled\n\n", TEXT_COLOR_SETTINGS)
         else:
             prompt_handler.ask_for_execution = True
-            gui_handler.print_text("SYSTEM INFO: \nDirect Code Execution Disabled\n\n", TEXT_COLOR_SETTINGS)
+            self.print_text("SYSTEM INFO: \nDirect Code Execution Disabled\n\n", TEXT_COLOR_SETTINGS)
     
     def toggle_execution_two(self):
         # toggle follow up question mode
         if self.toggle_state_two.get() == 1:
             prompt_handler.follow_up_questions = True
-            gui_handler.print_text("SYSTEM INFO: \nFollow-Up Questions Enabled\n\n", TEXT_COLOR_SETTINGS)
+            self.print_text("SYSTEM INFO: \nFollow-Up Questions Enabled\n\n", TEXT_COLOR_SETTINGS)
         else:
             prompt_handler.follow_up_questions = False
-            gui_handler.print_text("SYSTEM INFO: \nFollow-Up Questions Disabled\n\n", TEXT_COLOR_SETTINGS)        
+            self.print_text("SYSTEM INFO: \nFollow-Up Questions Disabled\n\n", TEXT_COLOR_SETTINGS)        
 
     def toggle_speech_output(self):
         if self.speech_output_state.get() == 1:
             prompt_handler.speech_output_enabled = True
-            gui_handler.print_text("SYSTEM INFO: \nSpeech Output Enabled\n\n", TEXT_COLOR_SETTINGS)
+            self.print_text("SYSTEM INFO: \nSpeech Output Enabled\n\n", TEXT_COLOR_SETTINGS)
         else:
             prompt_handler.speech_output_enabled = False
-            gui_handler.print_text("SYSTEM INFO: \nSpeech Output Disabled\n\n", TEXT_COLOR_SETTINGS)
+            self.print_text("SYSTEM INFO: \nSpeech Output Disabled\n\n", TEXT_COLOR_SETTINGS)
+
+    def toggle_auto_stop(self):
+        if self.auto_stop_state.get() == 1:
+            sound_handler.auto_stop = True
+            self.print_text("SYSTEM INFO: \nAuto-Stop on Silence Enabled\n\n", TEXT_COLOR_SETTINGS)
+        else:
+            sound_handler.auto_stop = False
+            self.print_text("SYSTEM INFO: \nAuto-Stop on Silence Disabled\n\n", TEXT_COLOR_SETTINGS)
 
     def change_input_mode(self):
         # Handle input mode change between keyboard and microphone
         if self.input_mode.get() == "keyboard":
             # Hide the record button — not needed in keyboard mode
             self.record_button.pack_forget()
-            gui_handler.print_text("SYSTEM INFO: \nInput Mode: Keyboard - Type your message and press Enter\n\n", TEXT_COLOR_SETTINGS)
+            self.print_text("SYSTEM INFO: \nInput Mode: Keyboard - Type your message and press Enter\n\n", TEXT_COLOR_SETTINGS)
             # Immediately enter typing mode
             self.start_keyboard_input()
         else:  # microphone mode
@@ -769,12 +1336,12 @@ class GuiHandler:
             # Show the record button again
             self.record_button.pack(fill=tk.X, padx=16, pady=(8, 4))
             self.record_button.config(text="Start Recording")
-            gui_handler.print_text("SYSTEM INFO: \nInput Mode: Microphone\n\n", TEXT_COLOR_SETTINGS)
+            self.print_text("SYSTEM INFO: \nInput Mode: Microphone\n\n", TEXT_COLOR_SETTINGS)
 
     def change_model(self, selection):
         model_name = selection.split("= ")[1] if "= " in selection else selection
         self.selected_model = model_name
-        gui_handler.print_text(f"SYSTEM INFO: \nModel changed to {model_name}.\n\n", TEXT_COLOR_SETTINGS)
+        self.print_text(f"SYSTEM INFO: \nModel changed to {model_name}.\n\n", TEXT_COLOR_SETTINGS)
 
     def change_voice(self, voice):
         # Extract voice name from selection (remove "Voice = " prefix)
@@ -784,19 +1351,37 @@ class GuiHandler:
         sound_handler.voice_agent = voice_name
         
         # Display confirmation message
-        gui_handler.print_text(f"SYSTEM INFO: \nVoice changed to {voice_name.capitalize()}.\n\n", TEXT_COLOR_SETTINGS)
+        self.print_text(f"SYSTEM INFO: \nVoice changed to {voice_name.capitalize()}.\n\n", TEXT_COLOR_SETTINGS)
         
-        # Play a sample sound
-        gui_handler.play_sound(f"example_{voice_name}.mp3")
+        # Play a sample sound, off the main thread so the window stays responsive
+        threading.Thread(target=self.play_sound, args=(f"example_{voice_name}.mp3",), daemon=True).start()
 
     # define what happens when a key is pressed
     def key_pressed(self, event):
         if prompt_handler.listen_to_keys:
-            character = event.char
-            gui_handler.print_text(f"USER: {character}\n\n", TEXT_COLOR_USER)
-            prompt_handler.pressed_key = character
-            prompt_handler.key_is_caught= True
+            self.hand_over_key(event.char)
+
+    def hand_over_key(self, character):
+        """Pass the key the pipeline is waiting for (see confirm_execution), only the first one counts."""
+        prompt_handler.listen_to_keys = False
+        self.print_text(f"USER: {character}\n\n", TEXT_COLOR_USER)
+        prompt_handler.pressed_keys.put(character)
     
+    def set_status(self, name, state):
+        """Thread-safe: show the readiness of a subsystem ("starting", "ready" or "failed") in the sidebar."""
+        self.root.after(0, self._set_status_impl, name, state)
+
+    def _set_status_impl(self, name, state):
+        colors = {"starting": self.colors['orange'], "ready": self.colors['green'], "failed": self.colors['red']}
+        label = self.status_labels.get(name)
+        if label is None:
+            label = tk.Label(
+                self.status_frame, font=('Segoe UI', 9), bg=self.colors['bg_sidebar'], anchor='w'
+            )
+            label.pack(fill=tk.X)
+            self.status_labels[name] = label
+        label.config(text=f"\u25cf  {name}: {state}", fg=colors.get(state, self.colors['fg']))
+
     def _sidebar_label(self, parent, text):
         """Create a section label in the sidebar."""
         tk.Label(
@@ -888,6 +1473,12 @@ class GuiHandler:
             command=self.toggle_speech_output, style='Sidebar.TCheckbutton'
         ).pack(fill=tk.X, padx=16)
 
+        self.auto_stop_state = tk.IntVar(value=int(VAD_AUTO_STOP))
+        ttk.Checkbutton(
+            sb, text="Auto-Stop on Silence", variable=self.auto_stop_state,
+            command=self.toggle_auto_stop, style='Sidebar.TCheckbutton'
+        ).pack(fill=tk.X, padx=16)
+
         self._sidebar_separator(sb)
 
         # --- Voice selection ---
@@ -929,6 +1520,22 @@ class GuiHandler:
         )
         self.reset_shell_button.pack(fill=tk.X, padx=16, pady=(4, 8))
 
+        self.stop_command_button = RoundedButton(
+            sb, text="Stop Command", command=self.stop_shell_command,
+            font=('Segoe UI', 9, 'bold'), fg='#ffffff', bg=c['orange'],
+            hover_bg='#ffb380', active_bg='#e68a52',
+            canvas_bg=c['bg_sidebar'], radius=12, height=34
+        )
+        self.stop_command_button.pack(fill=tk.X, padx=16, pady=(0, 8))
+
+        self._sidebar_separator(sb)
+
+        # --- Status of the subsystems that start in the background ---
+        self._sidebar_label(sb, "STATUS")
+        self.status_frame = tk.Frame(sb, bg=c['bg_sidebar'])
+        self.status_frame.pack(fill=tk.X, padx=16)
+        self.status_labels = {}
+
     def create_text_window(self):
         c = self.colors
         # Text area frame with rounded corners via container
@@ -941,6 +1548,7 @@ class GuiHandler:
             thumb_color=c['bg_card'], thumb_hover=c['fg_dim'], width=8
         )
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y, padx=(0, 2), pady=4)
+        self.text_scrollbar = scrollbar
 
         self.text_field = tk.Text(
             text_frame, wrap=tk.WORD, yscrollcommand=scrollbar.set,
@@ -1092,71 +1700,62 @@ class GuiHandler:
         self._update_bottom_panels()
 
     def shell_log(self, message):
-        """Thread-safe: append text to the PowerShell panel."""
-        self.root.after(0, self._shell_log_impl, message)
+        """Thread-safe: append text to the PowerShell panel (with the next log frame)."""
+        self.shell_sink.put(message)
 
     def _shell_log_impl(self, message):
         self.shell_text.config(state='normal')
         self.shell_text.insert(tk.END, message)
         self.shell_text.see(tk.END)
         self.shell_text.config(state='disabled')
+        self.shell_scrollback.trim()
 
     def clear_shell_log(self):
         """Clear the PowerShell panel content."""
         self.shell_text.config(state='normal')
         self.shell_text.delete('1.0', tk.END)
         self.shell_text.config(state='disabled')
+        self.shell_scrollback.clear()
+        self.shell_sink.clear()
 
     def debug_log(self, message):
-        """Thread-safe: schedules the actual write on the main thread."""
-        self.root.after(0, self._debug_log_impl, message)
-
-    def _debug_log_impl(self, message):
+        """Thread-safe: timestamps the message now, it is written with the next log frame."""
         t = time.time()
         ms = int((t % 1) * 1000)
-        timestamp = time.strftime("%H:%M:%S") + f".{ms:03d}"
-        line = f"[{timestamp}] {message}\n"
+        timestamp = time.strftime("%H:%M:%S", time.localtime(t)) + f".{ms:03d}"
+        self.debug_sink.put(f"[{timestamp}] {message}\n")
+
+    def _debug_log_impl(self, lines):
         self.debug_text.config(state='normal')
-        self.debug_text.insert(tk.END, line)
+        self.debug_text.insert(tk.END, lines)
         self.debug_text.see(tk.END)
         self.debug_text.config(state='disabled')
+        self.debug_scrollback.trim()
 
     # ----- Pipeline (runs on background thread) -----
 
     def reset_shell(self):
-        """Kill the current PowerShell process and start a fresh one."""
-        global shell_handler
-        try:
-            shell_handler.shell_process.terminate()
-            shell_handler.shell_process.wait(timeout=5)
-        except Exception:
-            shell_handler.shell_process.kill()
-        shell_handler = ShellHandler()
+        """Kill the current PowerShell processes and start fresh ones."""
+        if not startup_handler.is_ready("PowerShell"):
+            return
+        shell_pool.restart()
         self.clear_shell_log()
         self.print_text("SYSTEM INFO: \nPowerShell connection has been reset.\n\n", TEXT_COLOR_SETTINGS)
         PromptHandler.add_to_chat_history("PowerShell connection reset by user.", "system")
-        PromptHandler.save_chat_history(prompt_handler.chat_history)
         self.debug_log("PowerShell reset by user")
 
-    def _run_pipeline(self, user_input=None, from_speech=False, from_keyboard=False):
+    def stop_shell_command(self):
+        """Interrupt the commands that are currently running in PowerShell."""
+        if not startup_handler.is_ready("PowerShell"):
+            return
+        shell_pool.interrupt()
+        self.debug_log("Shell command interrupt requested by user")
+
+    def _run_pipeline(self, user_input=None, recording=None, from_keyboard=False):
         """Runs the full request pipeline off the main thread."""
-        pipeline_start = time.time()
         try:
-            self.debug_log("Pipeline started")
-
-            if from_speech:
-                user_input = SoundHandler.speech_to_text("audio_record.wav", openai_handler.OpenAiClient)
-
-            if not from_keyboard:
-                self.print_text(f"USER: \n{user_input}\n\n", TEXT_COLOR_USER)
-            PromptHandler.add_to_chat_history(user_input, "user")
-
-            OpenAiHandler.generate_AI_response(prompt_handler.chat_history, openai_handler.OpenAiClient)
-
-            self.debug_log(f"Pipeline finished. Total: {time.time()-pipeline_start:.2f}s")
-        except Exception as e:
-            self.debug_log(f"ERROR: {e}")
-            self.print_text(f"SYSTEM ERROR: \n{e}\n\n", TEXT_COLOR_POWER_SHELL)
+            # typed input is already in the text field
+            pipeline.run(user_input, recording, echo_input=not from_keyboard)
         finally:
             self.root.after(0, self._pipeline_finished)
 
@@ -1166,7 +1765,24 @@ class GuiHandler:
         if self.input_mode.get() == "keyboard":
             self.start_keyboard_input()
 
-    def start_gui(self):
+    def confirm_execution(self, commands, streamed):
+        """Show the proposal and wait (on the pipeline thread) for y/n or enter."""
+        # keys of an earlier prompt don't count
+        while not prompt_handler.pressed_keys.empty():
+            prompt_handler.pressed_keys.get_nowait()
+
+        # Show proposal with typewriter, then prompt for approval and listen for keys after it finishes
+        def _show_yn_prompt():
+            self.print_text("SYSTEM INFO: \nLet through? (y/n): \n", TEXT_COLOR_SETTINGS)
+            prompt_handler.listen_to_keys = True
+        PromptHandler.show_ai_message(f"AI PROPOSAL: \n{commands}\n\n", TEXT_COLOR_AI_PROPOSAL, streamed, self, on_complete=_show_yn_prompt)
+
+        # Wait for user key press (already on background thread, so this won't freeze the UI)
+        self.debug_log("Waiting for user approval (y/n)...")
+        key = prompt_handler.pressed_keys.get()
+        return key == "y" or key == "Y" or key == "\r"
+
+    def start(self):
         # Start the GUI event loop
         self.root.mainloop()
 
@@ -1175,44 +1791,101 @@ class GuiHandler:
 #-------------------------------------------------------
 
 class SoundHandler:
-    def __init__(self):
+    def __init__(self, ui):
+        self.ui = ui
         self.is_recording = False
-        self.frames = []
+        self.buffer = bytearray() # the current recording, 16 bit mono pcm at self.sample_rate
+        self.length = 0 # bytes of self.buffer recorded so far
+        self.segments = [] # futures of the transcripts of the segments cut off while recording
+        self.segment_start = 0
+        self.stt_executor = concurrent.futures.ThreadPoolExecutor(max_workers=STT_SEGMENT_WORKERS)
+        self.auto_stop = VAD_AUTO_STOP
+        self.on_auto_stop = None # called from the record thread with the generation that stopped
+        self.generation = 0
         self.voice_agent = "onyx"
 
-    def start_recording(self, name)->bool:
-        """Start recording audio from the microphone and save it to a file. Returns True if successful, False otherwise."""
+    def start_recording(self)->bool:
+        """Start recording audio from the microphone into memory. Returns True if successful, False otherwise."""
         self.is_recording = True
-        self.filename = name + ".wav"
         self.chunk = SOUND_CHUNK
         self.FORMAT = pyaudio.paInt16
         self.channels = SOUND_CHANNELS
-        self.sample_rate = SOUND_SAMPLE_RATE
         self.p = pyaudio.PyAudio()
         
         try:
-            # Only use input mode for recording
-            self.stream = self.p.open(
-                format=self.FORMAT,
-                channels=self.channels,
-                rate=self.sample_rate,
-                input=True,  # Only need input for recording
-                output=False,  # Don't use output during recording
-                frames_per_buffer=self.chunk)
+            # Only use input mode for recording, at 16 kHz if the microphone allows it
+            for sample_rate in (SOUND_SAMPLE_RATE, SOUND_FALLBACK_SAMPLE_RATE):
+                try:
+                    self.stream = self.p.open(
+                        format=self.FORMAT,
+                        channels=self.channels,
+                        rate=sample_rate,
+                        input=True,  # Only need input for recording
+                        output=False,  # Don't use output during recording
+                        frames_per_buffer=self.chunk)
+                    self.sample_rate = sample_rate
+                    break
+                except Exception:
+                    if sample_rate == SOUND_FALLBACK_SAMPLE_RATE:
+                        raise
             
             print("Recording...")
     
+            # preallocated, so recording never allocates or copies and can't outgrow SOUND_MAX_RECORD_SECONDS
+            self.buffer = bytearray(int(SOUND_MAX_RECORD_SECONDS * self.sample_rate) * 2)
+            self.length = 0
+            self.generation += 1
+            generation = self.generation
+
             def record_thread():
-                self.frames = []  # Reset frames list
+                self.segments = []
+                segment_start = 0
+                chunk_seconds = self.chunk / self.sample_rate
+                noise_floor = None
+                speech_seconds = segment_speech_seconds = silence_seconds = 0.0
                 while self.is_recording:
                     try:
                         data = self.stream.read(self.chunk, exception_on_overflow=False)
-                        self.frames.append(data)
                     except Exception as e:
                         print(f"Error in recording thread: {str(e)}")
                         break
+                    end = self.length + len(data)
+                    if end > len(self.buffer):
+                        self.ui.debug_log(f"Recording stopped at the maximum of {SOUND_MAX_RECORD_SECONDS}s")
+                        self.is_recording = False
+                        if self.on_auto_stop is not None:
+                            self.on_auto_stop(generation)
+                        break
+                    self.buffer[self.length:end] = data
+                    self.length = end
+                    # a chunk is speech if it is clearly louder than the quietest one so far
+                    rms = SoundHandler.frame_rms(data, self.chunk)[0]
+                    noise_floor = rms if noise_floor is None else min(noise_floor, rms)
+                    if rms > max(VAD_MIN_RMS, VAD_NOISE_FACTOR * noise_floor):
+                        speech_seconds += chunk_seconds
+                        segment_speech_seconds += chunk_seconds
+                        silence_seconds = 0.0
+                    else:
+                        silence_seconds += chunk_seconds
+                    # a pause after enough speech ends a segment, it is transcribed while recording goes on
+                    segment_seconds = (self.length - segment_start) / 2 / self.sample_rate
+                    if (segment_speech_seconds > 0 and silence_seconds >= STT_SEGMENT_PAUSE
+                            and segment_seconds >= STT_SEGMENT_MIN_SECONDS):
+                        self._send_segment(self.recorded(segment_start))
+                        segment_start = self.length
+                        segment_speech_seconds = 0.0
+                    if (self.auto_stop and speech_seconds >= VAD_MIN_SPEECH_SECONDS
+                            and silence_seconds >= VAD_SILENCE_SECONDS):
+                        self.is_recording = False
+                        if self.on_auto_stop is not None:
+                            self.on_auto_stop(generation)
+                self.segment_start = segment_start
+                self.stream.stop_stream()
+                self.stream.close()
+                self.p.terminate()
             
-            threading.Thread(target=record_thread).start()
+            self.record_thread = threading.Thread(target=record_thread)
+            self.record_thread.start()
             return True  # Recording started successfully
         
         except Exception as e:
@@ -1220,115 +1893,280 @@ class SoundHandler:
             self.p.terminate()
             error_message = f"Could not start recording: {str(e)}\n\n"
             print(error_message)
-            gui_handler.print_text(error_message, "red")
+            self.ui.print_text(error_message, "red")
             return False  # Failed to start recording
 
     def stop_recording(self):
+        """Stop the recording and return it as (segments, rest) for transcribe: the futures of the
+        segments sent while recording and the rest as 16 bit mono pcm at SOUND_SAMPLE_RATE. Nothing
+        in it is shared with the next recording."""
         self.is_recording = False
+        self.record_thread.join()
         print("Recording completed.")
-        full_path = os.path.join(gui_handler.files_path, self.filename)
-        wf = wave.open(full_path, "wb")
-        wf.setnchannels(self.channels)
-        wf.setsampwidth(self.p.get_sample_size(self.FORMAT))
-        wf.setframerate(self.sample_rate)
-        wf.writeframes(b"".join(self.frames))
-        wf.close()
-        self.frames = []
-
-
-    def text_to_speech(text, client, voice_agent):
-        gui_handler.debug_log("Text-to-speech (TTS API)...")
-        t = time.time()
-        speech_file_path = gui_handler.files_path + "/generated_audio.mp3"
-        response = client.audio.speech.create(
-            model=TTS_MODEL,
-            voice=voice_agent,
-            input=text
-        )
-        response.stream_to_file(speech_file_path)
-        gui_handler.debug_log(f"Text-to-speech done ({time.time()-t:.2f}s)")
-        gui_handler.play_sound("generated_audio.mp3")
-        #os.system("generated_audio.mp3")
-    
-    def speech_to_text(audio_file_path, client):
-        gui_handler.debug_log("Speech-to-text (Whisper API)...")
-        t = time.time()
-        full_path = os.path.join(gui_handler.files_path, audio_file_path)
-        audio_file = open(full_path, "rb")
-        transcript = client.audio.transcriptions.create(
-            model=SPEECH_TO_TEXT_MODEL,
-            file=audio_file
-        )
-        gui_handler.debug_log(f"Speech-to-text done ({time.time()-t:.2f}s)")
-        return transcript.text
+        # only the audio after the last segment is left, the segments are being transcribed already
+        pcm = self._to_speech_rate(self.recorded(self.segment_start))
+        rest = bytes(SoundHandler.trim_silence(pcm))
+        segments = list(self.segments)
+        self.ui.debug_log(f"Recording: {len(segments)} segments sent while recording, rest "
+                              f"{len(pcm) / 2 / SOUND_SAMPLE_RATE:.2f}s, "
+                              f"{len(rest) / 2 / SOUND_SAMPLE_RATE:.2f}s after trimming silence")
+        return segments, rest
+
+    def recorded(self, start=0):
+        """The recording from byte start on, as a view into the buffer (no copy)."""
+        return memoryview(self.buffer)[start:self.length]
+
+    def _to_speech_rate(self, pcm):
+        if self.sample_rate != SOUND_SAMPLE_RATE:
+            pcm = SoundHandler.resample(pcm, self.sample_rate, SOUND_SAMPLE_RATE)
+        return pcm
+
+    def _send_segment(self, pcm):
+        """Transcribe a finished segment in the background, the future is kept in self.segments."""
+        # a copy, the buffer is reused by the next recording while this one may still be queued
+        pcm = bytes(SoundHandler.trim_silence(self._to_speech_rate(pcm)))
+        if not pcm:
+            return
+
+        def transcribe():
+            startup_handler.wait("OpenAI")
+            return SoundHandler.speech_to_text(SoundHandler.encode_wav(pcm), openai_handler.OpenAiClient, self.ui)
+        self.segments.append(self.stt_executor.submit(tracer.bind(transcribe)))
 
-    # listen to the microphone for a given amount of seconds and return the text
-    def record_request(seconds, client):
-        # take wav file and return text through openai
-        def speech_to_text(audio_file_path):
-            audio_file= open(audio_file_path, "rb")
+    @staticmethod
+    def transcribe(recording, client, ui):
+        """Transcript of a recording from stop_recording: the segments sent while recording,
+        stitched together with the rest, which is transcribed now. Returns "" if there was no speech."""
+        segments, rest = recording
+        texts = []
+        if rest:
+            texts.append(SoundHandler.speech_to_text(SoundHandler.encode_wav(rest), client, ui))
+        texts = [segment.result() for segment in segments] + texts
+        return " ".join(text.strip() for text in texts if text.strip())
+
+    @staticmethod
+    def frame_rms(pcm, frame_length):
+        """Loudness of each complete frame of frame_length samples in 16 bit mono pcm."""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        count = len(samples) // frame_length
+        frames = samples[:count * frame_length].reshape(count, frame_length).astype(np.float32)
+        return np.sqrt(np.mean(frames * frames, axis=1))
+
+    @staticmethod
+    def trim_silence(pcm, sample_rate=SOUND_SAMPLE_RATE):
+        """Cut the silence before and after the speech, keeping VAD_TRIM_PADDING on both sides.
+        Returns b"" if nothing in pcm sounds like speech."""
+        frame_length = sample_rate * VAD_FRAME_MS // 1000
+        rms = SoundHandler.frame_rms(pcm, frame_length)
+        if len(rms) == 0:
+            return b""
+        # the quietest tenth of the recording is taken as the background noise
+        threshold = max(VAD_MIN_RMS, VAD_NOISE_FACTOR * float(np.percentile(rms, 10)))
+        speech = np.flatnonzero(rms > threshold)
+        if len(speech) == 0:
+            return b""
+        padding = int(VAD_TRIM_PADDING * sample_rate)
+        start = max(0, speech[0] * frame_length - padding)
+        end = min(len(pcm) // 2, (speech[-1] + 1) * frame_length + padding)
+        return pcm[start * 2:end * 2]
+
+    @staticmethod
+    def resample(pcm, from_rate, to_rate):
+        """Resample 16 bit mono pcm by linear interpolation (enough for speech recognition)."""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        count = int(len(samples) * to_rate / from_rate)
+        positions = np.arange(count) * (from_rate / to_rate)
+        resampled = np.interp(positions, np.arange(len(samples)), samples)
+        return np.round(resampled).astype(np.int16).tobytes()
+
+    @staticmethod
+    def encode_wav(pcm, sample_rate=SOUND_SAMPLE_RATE):
+        """Wrap 16 bit mono pcm into a wav file in memory."""
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wf:
+            wf.setnchannels(SOUND_CHANNELS)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(pcm)
+        return buffer.getvalue()
+
+
+    def text_to_speech(text, client, voice_agent, ui):
+        """Speak text, from the cache if it was spoken before, otherwise the audio is played while
+        it is still being synthesised."""
+        cacheable = len(text) <= TTS_CACHE_MAX_TEXT
+        audio = tts_cache.get(text, voice_agent) if cacheable else None
+        if audio is not None:
+            ui.debug_log(f"Text-to-speech from cache | {tts_cache.stats()}")
+            with tracer.span("tts", characters=len(text), cached=True) as span:
+                chunks = (audio[i:i + TTS_STREAM_CHUNK] for i in range(0, len(audio), TTS_STREAM_CHUNK))
+                ui.play_stream(chunks, TTS_SAMPLE_RATE)
+            ui.debug_log(f"Text-to-speech done, played until {span.duration:.2f}s")
+            return
+
+        ui.debug_log("Text-to-speech (TTS API, streaming)...")
+        received = []
+        complete = [False]
+        with tracer.span("tts", characters=len(text), cached=False) as span:
+            with client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=voice_agent,
+                input=text,
+                response_format="pcm"
+            ) as response:
+                def chunks():
+                    for chunk in response.iter_bytes(TTS_STREAM_CHUNK):
+                        if not received:
+                            seconds = time.perf_counter() - span.start
+                            tracer.sample("tts first audio", seconds)
+                            ui.debug_log(f"Text-to-speech first audio after {seconds:.2f}s")
+                        received.append(chunk)
+                        yield chunk
+                    complete[0] = True
+                ui.play_stream(chunks(), TTS_SAMPLE_RATE)
+        ui.debug_log(f"Text-to-speech done, played until {span.duration:.2f}s | {tts_cache.stats()}")
+
+        # only audio that was received completely (not cut off by a newer sound) is kept
+        if cacheable and complete[0]:
+            tts_cache.put(text, voice_agent, b"".join(received))
+    
+    def speech_to_text(audio, client, ui):
+        """Transcribe audio, the bytes of a wav file. It is uploaded from memory, nothing is written to disk."""
+        ui.debug_log("Speech-to-text (Whisper API)...")
+        with tracer.span("stt", upload_bytes=len(audio)) as span:
             transcript = client.audio.transcriptions.create(
-            model=SPEECH_TO_TEXT_MODEL, 
-            file=audio_file
+                model=SPEECH_TO_TEXT_MODEL,
+                file=("speech.wav", audio, "audio/wav")
             )
-            # print text to gui
-            gui_handler.print_text(f"USER: \n{transcript.text}\n\n", TEXT_COLOR_USER) 
-            return transcript.text
-        
-        # record the audio from the laptop microphone to wav file
-        def record_audio(name, seconds):
-            filename = name + ".wav"
-            chunk = SOUND_CHUNK
-            FORMAT = pyaudio.paInt16
-            channels = SOUND_CHANNELS
-            sample_rate = SOUND_SAMPLE_RATE
-            record_seconds = seconds
-            # initialize PyAudio object
-            p = pyaudio.PyAudio()
-            # open stream object as input & output
-            stream = p.open(format=FORMAT,
-                            channels=channels,
-                            rate=sample_rate,
-                            input=True,
-                            output=True,
-                            frames_per_buffer=chunk)
-            frames = []
-            print("Recording...")
-            for i in range(int(sample_rate / chunk * record_seconds)):
-                data = stream.read(chunk)
-                # if you want to hear your voice while recording
-                # stream.write(data)
-                frames.append(data)
-            # stop and close stream
-            stream.stop_stream()
-            stream.close()
-            # terminate pyaudio object
-            p.terminate()
-            print("Recording completed.")
-            # save audio file
-            # open the file in 'write bytes' mode
-            wf = wave.open(filename, "wb")
-            # set the channels
-            wf.setnchannels(channels)
-            # set the sample format
-            wf.setsampwidth(p.get_sample_size(FORMAT))
-            # set the sample rate
-            wf.setframerate(sample_rate)
-            # write the frames as bytes
-            wf.writeframes(b"".join(frames))
-            # close the file
-            wf.close()
+        ui.debug_log(f"Speech-to-text done ({span.duration:.2f}s, {len(audio) // 1024} kB uploaded)")
+        return transcript.text
+
+
+class TtsCache:
+    """Synthesised speech on disk, one file per (TTS_MODEL, voice, text) named by its sha256. Hits
+    play at once without an api call. Above max_bytes the least recently used files are deleted
+    (a hit touches its file, so the modification time is the last use)."""
 
+    def __init__(self, path, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
 
-        record_audio("audio_record", seconds)
-        return(speech_to_text("audio_record.wav"))
+    def file_path(self, text, voice):
+        key = hashlib.sha256(f"{TTS_MODEL}\0{voice}\0{text.strip()}".encode("utf-8")).hexdigest()
+        return os.path.join(self.path, f"{key}.pcm")
+
+    def get(self, text, voice):
+        """Return the cached audio of text or None."""
+        file_path = self.file_path(text, voice)
+        try:
+            with open(file_path, "rb") as f:
+                audio = f.read()
+            os.utime(file_path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return audio
+
+    def put(self, text, voice, audio):
+        file_path = self.file_path(text, voice)
+        # written under a temporary name, so a half written file is never played
+        temp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(audio)
+        os.replace(temp_path, file_path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.path):
+                if not name.endswith(".pcm"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    continue
+                total -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            rate = self.hits / lookups * 100 if lookups else 0
+            return f"tts cache hits {self.hits}/{lookups} ({rate:.0f} %)"
+
+    def seed(self, phrases_file, voice, client, ui):
+        """Synthesise the phrases of phrases_file (one per line) that are not cached yet."""
+        if not os.path.exists(phrases_file):
+            return
+        with open(phrases_file, "r", encoding="utf-8") as f:
+            phrases = [line.strip() for line in f if line.strip()]
+        missing = [phrase for phrase in phrases if not os.path.exists(self.file_path(phrase, voice))]
+        for phrase in missing:
+            with client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=voice,
+                input=phrase,
+                response_format="pcm"
+            ) as response:
+                self.put(phrase, voice, response.read())
+        ui.debug_log(f"TTS cache seeded with {len(missing)} of {len(phrases)} phrases ({voice})")
 
 #-------------------------------------------------------
 # Connection to PowerShell
 #-------------------------------------------------------
 
 class ShellHandler:
-    def __init__(self):
+    # one line each, PowerShell reads "-Command -" line by line; the baseline is what reset_state returns to
+    BASELINE_SCRIPT = ("$global:AutoshellBaseline = @{ Location = (Get-Location).Path; "
+                       "Variables = @((Get-Variable -Scope Global).Name) + 'AutoshellBaseline'; "
+                       "Functions = @((Get-ChildItem Function:).Name); Aliases = @((Get-ChildItem Alias:).Name) }")
+    RESET_SCRIPT = ("Set-Location -LiteralPath $AutoshellBaseline.Location; "
+                    "@(Get-Variable -Scope Global | Where-Object { $AutoshellBaseline.Variables -notcontains $_.Name }) | "
+                    "ForEach-Object { Remove-Variable -Name $_.Name -Scope Global -Force -ErrorAction SilentlyContinue }; "
+                    "@(Get-ChildItem Function: | Where-Object { $AutoshellBaseline.Functions -notcontains $_.Name }) | "
+                    "Remove-Item -Force -ErrorAction SilentlyContinue; "
+                    "@(Get-ChildItem Alias: | Where-Object { $AutoshellBaseline.Aliases -notcontains $_.Name }) | "
+                    "Remove-Item -Force -ErrorAction SilentlyContinue")
+
+    def __init__(self, ui, powershell_exe=None):
+        self.ui = ui
+        if powershell_exe:
+            # path already known (e.g. from the primary session of the pool)
+            self.powershell_exe = powershell_exe
+        else:
+            self.powershell_exe = ShellHandler.find_powershell(ui.cache_path)
+
+        # set by interrupt() to stop waiting for the running command
+        self.interrupt_requested = threading.Event()
+        self.last_stderr_lines = 0
+        self.start_process()
+
+    @staticmethod
+    def find_powershell(cache_path):
+        # probing takes seconds, so the result of the last probe is reused while it is still valid
+        cache_file = os.path.join(cache_path, POWERSHELL_PATH_FILE)
+        if os.path.exists(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as f:
+                cached_path = f.read().strip()
+            if cached_path and (os.path.exists(cached_path) or shutil.which(cached_path)):
+                return cached_path
+
         # Use common PowerShell locations or search in PATH
         powershell_paths = [
             r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe",
@@ -1351,166 +2189,1179 @@ class ShellHandler:
         
         if not powershell_exe:
             raise FileNotFoundError("Could not find PowerShell executable. Please ensure PowerShell is installed.")
-        
+        os.makedirs(cache_path, exist_ok=True)
+        with open(cache_file, "w", encoding="utf-8") as f:
+            f.write(powershell_exe)
+        return powershell_exe
+
+    def start_process(self):
+        """Start the PowerShell process and the reader threads for its stdout and stderr."""
+        # on windows the process gets its own group so that interrupting it does not hit Autoshell
+        creationflags = subprocess.CREATE_NEW_PROCESS_GROUP if os.name == "nt" else 0
         self.shell_process = subprocess.Popen(
-            [powershell_exe, "-Command", "-"], 
-            stdin=subprocess.PIPE, 
-            stdout=subprocess.PIPE, 
-            text=True, 
-            encoding='utf-8'
+            [self.powershell_exe, "-Command", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            creationflags=creationflags
         )
+        # both pipes are read on their own threads and multiplexed into one queue,
+        # so that waiting for output can use a timeout
+        self.output_queue = queue.Queue()
+        for stream_name, pipe in (("stdout", self.shell_process.stdout), ("stderr", self.shell_process.stderr)):
+            threading.Thread(
+                target=ShellHandler.read_pipe,
+                args=(pipe, stream_name, self.output_queue),
+                daemon=True
+            ).start()
+        # remember the fresh state, it produces no output
+        self.shell_process.stdin.write(ShellHandler.BASELINE_SCRIPT + "\n")
+        self.shell_process.stdin.flush()
+
+    @staticmethod
+    def read_pipe(pipe, stream_name, output_queue):
+        for line in pipe:
+            output_queue.put((stream_name, line))
+        output_queue.put((stream_name, None)) # end of file, the process is gone
+
+    def restart(self):
+        """Kill the current PowerShell process and start a fresh one."""
+        try:
+            self.shell_process.terminate()
+            self.shell_process.wait(timeout=5)
+        except Exception:
+            self.shell_process.kill()
+        self.start_process()
+
+    def reset_state(self, timeout=SHELL_COMMAND_TIMEOUT):
+        """Bring the session back to how it started: the start folder, and the global variables,
+        functions and aliases defined since are removed. If that fails the process is restarted."""
+        try:
+            self.run(ShellHandler.RESET_SCRIPT, timeout, stream=False)
+        except Exception as e:
+            self.ui.debug_log(f"Could not reset PowerShell session, restarting it: {e}")
+            self.restart()
 
-    def catch_shell_output(self):
-        shell_output = ""
-        for line in self.shell_process.stdout:
-            if line == "IDENTIFIER_251223\n": # search for the identifier to know the end of the output
+    def interrupt(self):
+        """Ask the running command to stop, catch_shell_output takes care of the rest."""
+        self.interrupt_requested.set()
+
+    def interrupt_running_command(self):
+        """Try to stop the running command without losing the session: programs started by
+        the session are killed, which ends native commands like winget or ping."""
+        try:
+            if os.name == "nt":
+                subprocess.run(
+                    [self.powershell_exe, "-NoProfile", "-Command",
+                     f"Get-CimInstance Win32_Process -Filter 'ParentProcessId={self.shell_process.pid}' | "
+                     "ForEach-Object { Stop-Process -Id $_.ProcessId -Force }"],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    timeout=SHELL_INTERRUPT_GRACE,
+                    check=False
+                )
+            else:
+                self.shell_process.send_signal(signal.SIGINT)
+        except Exception as e:
+            self.ui.debug_log(f"Could not interrupt shell command: {e}")
+
+    def list_known_commands(self):
+        """Return the names of all cmdlets, functions and aliases, queried in a separate process
+        so that the interactive session is not blocked."""
+        result = subprocess.run(
+            [self.powershell_exe, "-NoProfile", "-Command",
+             "Get-Command -CommandType Cmdlet,Function,Alias | Select-Object -ExpandProperty Name"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            timeout=120,
+            check=False
+        )
+        return [name.strip() for name in result.stdout.splitlines() if name.strip()]
+
+    def catch_shell_output(self, timeout=None, stream=True):
+        """Read the output of the running commands up to the identifier and return it as a list of lines.
+        stdout and stderr are merged in the order they arrive. While reading, new lines are pushed to
+        the PowerShell panel in batches every SHELL_STREAM_INTERVAL seconds (if stream is True).
+        After timeout seconds (or interrupt()) the command is interrupted, if it still does not finish
+        within SHELL_INTERRUPT_GRACE seconds the PowerShell process is restarted."""
+        process = self.shell_process
+        output_queue = self.output_queue
+        start = time.time()
+        deadline = start + timeout if timeout else None
+        hard_deadline = None
+        waiting_for = {"stdout", "stderr"}
+        lines = []
+        pending = []
+        stderr_lines = 0
+        last_flush = time.time()
+        while waiting_for:
+            now = time.time()
+            if hard_deadline is None and (self.interrupt_requested.is_set() or (deadline and now >= deadline)):
+                reason = "stopped by user" if self.interrupt_requested.is_set() else f"exceeded {timeout}s"
+                self.ui.debug_log(f"Shell command {reason}, interrupting...")
+                self.interrupt_running_command()
+                hard_deadline = time.time() + SHELL_INTERRUPT_GRACE
+                lines.append(f"\nSYSTEM INFO: The command was interrupted ({reason}).\n")
+            if hard_deadline and now >= hard_deadline:
+                self.ui.debug_log(f"Shell command did not stop, restarting PowerShell ({now-start:.2f}s)")
+                self.restart()
+                lines.append("\nSYSTEM INFO: The command did not stop and the PowerShell session was restarted, variables and the current folder are reset.\n")
                 break
-            shell_output += line
-        return shell_output
+
+            wait = SHELL_STREAM_INTERVAL
+            if hard_deadline:
+                wait = min(wait, max(hard_deadline - now, 0))
+            elif deadline:
+                wait = min(wait, max(deadline - now, 0))
+            try:
+                stream_name, line = output_queue.get(timeout=wait)
+            except queue.Empty:
+                stream_name, line = None, None
+            else:
+                if line is None:
+                    # the process ended (exit command or crash), restart it unless that already happened
+                    self.ui.debug_log("PowerShell process ended, restarting it")
+                    if self.shell_process is process:
+                        self.restart()
+                    lines.append("\nSYSTEM INFO: The PowerShell process ended and was restarted.\n")
+                    break
+                if line == "IDENTIFIER_251223\n": # search for the identifier to know the end of the output
+                    waiting_for.discard(stream_name)
+                    continue
+                if stream_name == "stderr":
+                    stderr_lines += 1
+                lines.append(line)
+                if stream:
+                    pending.append(line)
+
+            if pending and time.time() - last_flush >= SHELL_STREAM_INTERVAL:
+                self.ui.shell_log("".join(pending))
+                pending = []
+                last_flush = time.time()
+        if pending:
+            self.ui.shell_log("".join(pending))
+        self.interrupt_requested.clear()
+        self.last_stderr_lines = stderr_lines
+        return lines
 
     def send_shell_commands(self, commands):
-        commands += "\necho 'IDENTIFIER_251223'\n" # Identifier is added to the end of the commands to know when to stop reading the output
+        # Identifier is added to the end of the commands on both streams to know when to stop reading the output
+        commands += "\necho 'IDENTIFIER_251223'\n[Console]::Error.WriteLine('IDENTIFIER_251223')\n"
         commands = "clear\n" + commands
         self.shell_process.stdin.write(commands)
         self.shell_process.stdin.flush()
         return commands
 
-    def save_to_file(self, shell_output, commands, filename):
+    def save_to_file(self, output_lines, commands, filename):
         # ensure logs directory exists
-        os.makedirs(gui_handler.log_path, exist_ok=True)
-        file_path = os.path.join(gui_handler.log_path, filename)
+        os.makedirs(self.ui.log_path, exist_ok=True)
+        file_path = os.path.join(self.ui.log_path, filename)
 
         # make it utf-8 so that also korean or russian characters can be saved
         with open(file_path, "a", encoding="utf-8") as f:
             f.write("commands:\n")
             f.write(commands)
             f.write("\n\noutput:\n")
-            f.write(shell_output)
+            f.writelines(output_lines)
 
-    def execute(self, commands):
-        gui_handler.debug_log("Shell execution...")
-        t = time.time()
+    @staticmethod
+    def output_for_model(output_lines, model):
+        """Return the output as it goes into the chat history of model and the number of left out lines."""
+        encoding = PromptHandler.encoding_for_model(model)
+        return ShellHandler.truncate_output(output_lines, MAX_TOKENS_SHELL_ANSWER, encoding)
+
+    @staticmethod
+    def truncate_output(output_lines, max_tokens, encoding, head_ratio=None):
+        """Shorten the output to at most max_tokens tokens by keeping its head and its tail (where errors
+        and summaries usually are) and marking what was left out in between. Only windows of characters
+        about as large as the budget are encoded, so huge outputs (or huge single lines) never are completely.
+        Returns the text and the number of elided lines (0 if the output fits)."""
+        if head_ratio is None:
+            head_ratio = SHELL_ANSWER_HEAD_RATIO
+
+        def count(text):
+            return len(encoding.encode(text, disallowed_special=()))
+
+        def window_tokens(line, limit, from_end=False):
+            # tokens of a window of characters at the start (or end) of line that holds more than limit
+            # tokens, or of the whole line if it is shorter; the window grows until it is big enough
+            window = (max(limit, 0) + 16) * 4
+            while True:
+                if window >= len(line):
+                    return encoding.encode(line, disallowed_special=()), True
+                # the token at the cut may be split differently, so a few tokens more are asked for
+                tokens = encoding.encode(line[-window:] if from_end else line[:window], disallowed_special=())
+                if len(tokens) > limit + 8:
+                    return tokens, False
+                window *= 2
+
+        line_counts = {}    # line index -> (tokens counted, whether that was the whole line)
+
+        def bounded_count(index, limit):
+            # the token count of a line, or a number above limit if it has more
+            known, whole = line_counts.get(index, (0, False))
+            if not whole and known <= limit:
+                tokens, whole = window_tokens(output_lines[index], limit)
+                known = len(tokens)
+                line_counts[index] = (known, whole)
+            return known
+
+        def head_part(line, limit):
+            tokens, _ = window_tokens(line, limit)
+            return encoding.decode(tokens[:limit]) if limit > 0 else ""
+
+        def tail_part(line, limit):
+            tokens, _ = window_tokens(line, limit, from_end=True)
+            return encoding.decode(tokens[-limit:]) if limit > 0 else ""
+
+        # count from the start until the budget is exceeded, if that never happens the output fits
+        used = 0
+        for index in range(len(output_lines)):
+            used += bounded_count(index, max_tokens)
+            if used > max_tokens:
+                break
+        else:
+            text = "".join(output_lines)
+            if count(text) <= max_tokens:
+                return text, 0
+
+        available = max_tokens - count(f"\n[... {len(output_lines)} lines ({10 ** 12} characters) elided ...]\n")
+        # token counts of single lines don't add up exactly, so the budget is tightened until the result fits
+        for _ in range(5):
+            head_budget = max(int(available * head_ratio), 0)
+            tail_budget = max(available - head_budget, 0)
+
+            # head: whole lines while they fit, then the start of the next line
+            head = []
+            used = 0
+            head_end = 0
+            kept_partial = 0
+            while head_end < len(output_lines):
+                tokens = bounded_count(head_end, head_budget - used)
+                if used + tokens > head_budget:
+                    break
+                head.append(output_lines[head_end])
+                used += tokens
+                head_end += 1
+            head_partial = ""
+            if head_end < len(output_lines):
+                head_partial = head_part(output_lines[head_end], head_budget - used)
+                head.append(head_partial)
+                kept_partial += len(head_partial)
+
+            # tail: whole lines from the end while they fit, then the end of the line before, which
+            # may be the line the head ended in (a single huge line keeps its start and its end)
+            tail = []
+            used = 0
+            tail_start = len(output_lines)
+            while tail_start - 1 > head_end:
+                tokens = bounded_count(tail_start - 1, tail_budget - used)
+                if used + tokens > tail_budget:
+                    break
+                tail_start -= 1
+                tail.append(output_lines[tail_start])
+                used += tokens
+            if used < tail_budget:
+                line = output_lines[tail_start - 1]
+                partial = tail_part(line, tail_budget - used)
+                if tail_start - 1 == head_end:
+                    # the start and the end of the same line must not overlap
+                    room = len(line) - len(head_partial)
+                    if len(partial) > room:
+                        partial = partial[len(partial) - room:] if room > 0 else ""
+                tail.append(partial)
+                kept_partial += len(partial)
+            tail.reverse()
+
+            elided_lines = tail_start - head_end
+            elided_chars = sum(len(line) for line in output_lines[head_end:tail_start]) - kept_partial
+            marker = f"\n[... {elided_lines} lines ({max(elided_chars, 0)} characters) elided ...]\n"
+            text = "".join(head) + marker + "".join(tail)
+            overshoot = count(text) - max_tokens
+            if overshoot <= 0:
+                return text, elided_lines
+            available -= overshoot + 1
+        # still too long after all passes (only with tiny budgets), cut the result itself
+        return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]), elided_lines
+
+    def run(self, commands, timeout=SHELL_COMMAND_TIMEOUT, stream=True):
+        """Execute commands in this session and return the output lines. With stream, the commands
+        and their output are shown live in the PowerShell panel."""
+        if stream:
+            self.ui.shell_log(f"PS> {commands}\n")
+        self.interrupt_requested.clear()
         self.send_shell_commands(commands)
-        shell_output = self.catch_shell_output()
-        gui_handler.debug_log(f"Shell execution done ({time.time()-t:.2f}s)")
-        self.save_to_file(shell_output, commands, "complete_command_history.txt")
-
-        gui_handler.print_text(f"POWER SHELL: \n{shell_output}\n\n", TEXT_COLOR_POWER_SHELL)
-        clean_commands = commands.replace("clear\n", "").replace("\necho 'IDENTIFIER_251223'\n", "")
-        gui_handler.shell_log(f"PS> {clean_commands}\n{shell_output}\n")
-
-        # count tokens of the power shell answer, also count the letters of power shell answer
-        shell_answer_tokens = PromptHandler.num_tokens_from_string(shell_output, 'cl100k_base') #cl100k_base #p50k_base
-        shell_answer_letters = len(shell_output)
-
-        # if the answer is too long, the cut it down
-        if shell_answer_tokens > MAX_TOKENS_SHELL_ANSWER:
-            # check how many percentage we are too long in terms of tokens, then cut the answer down by that percentage (in terms of letters)
-            percentage_too_long = (shell_answer_tokens-MAX_TOKENS_SHELL_ANSWER)/shell_answer_tokens
-            shell_output = shell_output[:int(round(shell_answer_letters*(1-percentage_too_long), 0))]
-            shell_output += f"\n\nSYSTEM INFO: \nPower Shell Answer exceeds {MAX_TOKENS_SHELL_ANSWER} tokens and was thus shortened.\n\n"
-            # speak to the user
-            gui_handler.print_text(f"SYSTEM INFO: \nPower Shell Answer exceeds {MAX_TOKENS_SHELL_ANSWER} tokens and was thus shortened for the prompt history.\n\n", TEXT_COLOR_SETTINGS)
+        output_lines = self.catch_shell_output(timeout, stream)
+        if stream:
+            self.ui.shell_log("\n")
+        return output_lines
+
+    def execute(self, commands, timeout=SHELL_COMMAND_TIMEOUT):
+        self.ui.debug_log("Shell execution...")
+        with tracer.span("shell") as span:
+            output_lines = self.run(commands, timeout)
+            span.args.update(lines=len(output_lines), stderr_lines=self.last_stderr_lines)
+        self.ui.debug_log(f"Shell execution done ({span.duration:.2f}s, {len(output_lines)} lines, {self.last_stderr_lines} on stderr)")
+        self.handle_output(commands, output_lines)
+
+    def handle_output(self, commands, output_lines):
+        """Log the output, show it in the conversation and hand it (shortened if needed) to the ai."""
+        self.save_to_file(output_lines, commands, "complete_command_history.txt")
+
+        # the full output is in the PowerShell panel and the log, the conversation shows what the ai gets
+        shell_output, elided_lines = ShellHandler.output_for_model(output_lines, self.ui.selected_model)
+        self.ui.print_text(f"POWER SHELL: \n{shell_output}\n\n", TEXT_COLOR_POWER_SHELL)
+        if elided_lines:
+            self.ui.print_text(f"SYSTEM INFO: \nPower Shell Answer exceeds {MAX_TOKENS_SHELL_ANSWER} tokens, {elided_lines} lines in the middle were left out of the prompt history.\n\n", TEXT_COLOR_SETTINGS)
 
-        
         PromptHandler.add_to_chat_history(shell_output, "system")
 
-        # save the message stream
-        PromptHandler.save_chat_history(prompt_handler.chat_history)
+#-------------------------------------------------------
+# Pool of PowerShell sessions
+#-------------------------------------------------------
+
+class ShellPool:
+    """A primary PowerShell session plus warm worker sessions. Blocks of independent read-only
+    queries are spread over the sessions and run in parallel, everything else (and all state
+    like the current folder or variables) stays pinned to the primary session."""
+
+    # verbs of cmdlets that only read state and can therefore run in any session
+    READ_ONLY_VERBS = {
+        "get", "test", "measure", "resolve", "find", "search", "compare", "select",
+        "sort", "where", "format", "group", "convertto", "convertfrom"
+    }
+    # native programs and aliases that only read state
+    READ_ONLY_COMMANDS = {
+        "ipconfig", "systeminfo", "hostname", "whoami", "netstat", "tasklist", "nslookup",
+        "ping", "tracert", "ls", "dir", "gci", "gc", "cat", "type", "gps", "ps", "gsv",
+        "sort", "select", "where", "ft", "fl", "measure",
+        # of the Out-* cmdlets only these two don't write anywhere (Out-File would be a dependency)
+        "out-string", "out-null"
+    }
+
+    def __init__(self, ui, size, powershell_exe=None):
+        self.ui = ui
+        self.primary = ShellHandler(ui, powershell_exe)
+        self._primary_lock = threading.Lock() # the primary session runs one query at a time
+        self.workers = []
+        self._idle_workers = queue.Queue()
+        # worker sessions are started in the background, they join the pool once they are ready
+        for _ in range(size - 1):
+            threading.Thread(target=self._start_worker, daemon=True).start()
+
+    def _start_worker(self):
+        try:
+            worker = ShellHandler(self.ui, self.primary.powershell_exe)
+        except Exception as e:
+            print(f"Could not start PowerShell worker session: {e}")
+            return
+        self.workers.append(worker)
+        self._idle_workers.put(worker)
+
+    def acquire(self, timeout=None):
+        """Take an idle worker session, returns None if there is none within timeout."""
+        try:
+            return self._idle_workers.get(timeout=timeout) if timeout else self._idle_workers.get_nowait()
+        except queue.Empty:
+            return None
+
+    def release(self, worker):
+        self._idle_workers.put(worker)
+
+    def restart(self):
+        for session in [self.primary] + list(self.workers):
+            session.restart()
+
+    def interrupt(self):
+        for session in [self.primary] + list(self.workers):
+            session.interrupt()
+
+    @staticmethod
+    def split_independent(commands):
+        """Split a block of commands into independent read-only queries (one per line).
+        Returns a list with the whole block if the commands depend on each other or change state."""
+        lines = [line.strip() for line in commands.splitlines() if line.strip() and not line.strip().startswith("#")]
+        if len(lines) < 2:
+            return [commands]
+        for line in lines:
+            # variables, redirections, script blocks and line continuations tie lines together, and
+            # subexpressions or & / . invocations can run any command inside an otherwise harmless line
+            if re.search(r"[$;>{}`()&]|[|,]$|(^|[|\s])\.\s", line):
+                return [commands]
+            for segment in line.split("|"):
+                words = segment.split()
+                if not words:
+                    return [commands]
+                name = words[0].lower()
+                verb = name.split("-")[0] if "-" in name else None
+                if name not in ShellPool.READ_ONLY_COMMANDS and verb not in ShellPool.READ_ONLY_VERBS:
+                    return [commands]
+        return lines
+
+    def execute(self, commands, timeout=SHELL_COMMAND_TIMEOUT):
+        """Execute a block of commands and hand the output to the ai, like ShellHandler.execute.
+        Independent queries are run concurrently and their outputs are merged in order."""
+        queries = ShellPool.split_independent(commands)
+        if len(queries) < 2 or self._idle_workers.empty():
+            self.primary.execute(commands, timeout)
+            return
+
+        self.ui.debug_log(f"Shell execution ({len(queries)} independent queries in parallel)...")
+        with tracer.span("shell", queries=len(queries)) as span:
+            # workers have to look at the same folder as the primary session
+            cwd = "".join(self.primary.run("(Get-Location).Path", timeout, stream=False)).strip()
+            cwd = cwd.replace("'", "''")
+            results = [None] * len(queries)
+
+            def run_query(index):
+                with tracer.span("shell query", query=queries[index]):
+                    worker = self.acquire(timeout)
+                    if worker is None:
+                        # no worker became free (they hang on earlier queries), queue up on the primary
+                        with self._primary_lock:
+                            results[index] = self.primary.run(queries[index], timeout, stream=False)
+                        return
+                    try:
+                        results[index] = worker.run(f"Set-Location -LiteralPath '{cwd}'\n{queries[index]}", timeout, stream=False)
+                    finally:
+                        self.release(worker)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.workers) or 1) as executor:
+                list(executor.map(tracer.bind(run_query), range(len(queries))))
+
+            output_lines = []
+            for query, lines in zip(queries, results):
+                self.ui.shell_log(f"PS> {query}\n{''.join(lines)}\n")
+                output_lines.extend(lines)
+            span.args["lines"] = len(output_lines)
+        self.ui.debug_log(f"Shell execution done ({span.duration:.2f}s, {len(output_lines)} lines, {len(queries)} queries on {min(len(queries), len(self.workers))} sessions)")
+        self.primary.handle_output(commands, output_lines)
 
 #-------------------------------------------------------
 # Connection to Open AI API
 #-------------------------------------------------------
 
+class StructuredReplyStream:
+    """Decodes the "content" string of a structured JSON reply incrementally while it is
+    streamed, so the message can be shown before the JSON object is complete."""
+
+    ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+    CONTENT_START = re.compile(r'"content"\s*:\s*"')
+
+    def __init__(self):
+        self._raw = ""
+        self._pos = None    # index of the next undecoded character of the content value
+        self._done = False
+
+    def feed(self, delta):
+        """Add the next piece of the JSON text and return the newly decoded content text."""
+        self._raw += delta
+        if self._done:
+            return ""
+        if self._pos is None:
+            match = self.CONTENT_START.search(self._raw)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        raw = self._raw
+        i = self._pos
+        decoded = []
+        while i < len(raw):
+            char = raw[i]
+            if char == '"':
+                self._done = True
+                break
+            if char != '\\':
+                decoded.append(char)
+                i += 1
+                continue
+            # escape sequence, wait for the rest of it if it is not complete yet
+            if i + 1 >= len(raw):
+                break
+            if raw[i + 1] != 'u':
+                decoded.append(self.ESCAPES.get(raw[i + 1], raw[i + 1]))
+                i += 2
+                continue
+            length = 6
+            if i + 6 <= len(raw) and 0xD800 <= int(raw[i + 2:i + 6], 16) < 0xDC00:
+                length = 12  # surrogate pair, decode both halves together
+            if i + length > len(raw):
+                break
+            decoded.append(json.loads('"' + raw[i:i + length] + '"'))
+            i += length
+        self._pos = i
+        return "".join(decoded)
+
+
 class OpenAiHandler:
 
     def __init__(self):
-        self.OpenAiClient = OpenAI(
+        self.OpenAiClient = openai.OpenAI(
             api_key=os.environ[OPEN_AI_API_KEY_ENV_VARIABLE],
         )
 
-    def generate_AI_response(chat_history, client):
-        model = gui_handler.selected_model
-        gui_handler.debug_log(f"Chat completions ({model})...")
-        t = time.time()
-        response = client.chat.completions.create(
-            model=model,
-            messages=chat_history
-        )
-
-        response_message = response.choices[0].message.content
-        gui_handler.debug_log(f"Chat completions done ({time.time()-t:.2f}s)") 
+    def generate_AI_response(chat_history, client, ui):
+        model = ui.selected_model
+        # make room in the context window before the history is sent
+        if not prompt_handler.context_manager.fit(chat_history, model):
+            # start over with the last message only
+            last_message = chat_history[-1]
+            prompt_handler.chat_history = PromptHandler.reset_chat_history(ui)
+            PromptHandler.add_to_chat_history(last_message["content"], last_message["role"])
+            ui.print_text("SYSTEM INFO: \nMaximum number of tokens reached, chat history reset.\n\n", TEXT_COLOR_SETTINGS)
+            chat_history = prompt_handler.chat_history
+        structured = RESPONSE_MODE == "structured"
+        ui.debug_log(f"Chat completions ({model})...")
+        with tracer.span("llm", model=model) as span:
+            if MODEL_STREAM_RESPONSE:
+                response_message = OpenAiHandler.stream_AI_response(chat_history, client, ui, model, structured)
+            else:
+                extra_arguments = {"response_format": STRUCTURED_RESPONSE_FORMAT} if structured else {}
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=chat_history,
+                    **extra_arguments
+                )
+                response_message = response.choices[0].message.content
+        ui.debug_log(f"Chat completions done ({span.duration:.2f}s)")
 
         # check if the response is the same as the last one
         if response_message == prompt_handler.last_ai_response:
             # if so, then reset the chat history
-            prompt_handler.chat_history = PromptHandler.reset_chat_history()
-            gui_handler.print_text(f"SYSTEM INFO: \nSame AI response as last time, chat history reset.\n\n", TEXT_COLOR_SETTINGS)
+            prompt_handler.chat_history = PromptHandler.reset_chat_history(ui)
+            ui.print_text(f"SYSTEM INFO: \nSame AI response as last time, chat history reset.\n\n", TEXT_COLOR_SETTINGS)
 
-        # check if message needs to be forwarded to the user or to the shell
-        PromptHandler.forward_by_ai(response_message)
+        streamed = MODEL_STREAM_RESPONSE and bool(response_message)
 
-    def generate_forwarding_decision(forwarding_chat_history, client):
-        model = gui_handler.selected_model
-        gui_handler.debug_log(f"Forwarding decision ({model})...")
-        t = time.time()
-        response = client.chat.completions.create(
+        # in structured mode the reply already says where it has to go, no second call needed
+        if structured:
+            reply = OpenAiHandler.parse_structured_reply(response_message)
+            if reply is not None:
+                PromptHandler.forward_by_ai(reply["content"], ui, streamed=streamed, answer_type=reply["target"])
+                return
+            ui.debug_log("Structured reply could not be parsed, using forwarding decision")
+
+        # check if message needs to be forwarded to the user or to the shell
+        PromptHandler.forward_by_ai(response_message, ui, streamed=streamed)
+
+    def stream_AI_response(chat_history, client, ui, model, structured=False):
+        """Request the completion with stream=True, render the deltas into the conversation
+        view as they arrive and return the full message once the stream is finished."""
+        t = time.perf_counter()
+        extra_arguments = {"response_format": STRUCTURED_RESPONSE_FORMAT} if structured else {}
+        stream = client.chat.completions.create(
             model=model,
-            messages=forwarding_chat_history
+            messages=chat_history,
+            stream=True,
+            **extra_arguments
         )
 
+        # structured replies are JSON, only the decoded "content" field is shown while streaming
+        reply_stream = StructuredReplyStream() if structured else None
+        # the talk_to_user(" prefix and the closing ") are hidden while streaming
+        prefix = 'talk_to_user("'
+        response_message = ""
+        shown = 0
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if not response_message:
+                tracer.sample("llm first token", time.perf_counter() - t)
+                ui.debug_log(f"First token after {time.perf_counter()-t:.2f}s")
+                ui.begin_stream("AI: \n", TEXT_COLOR_AI)
+            response_message += delta
+
+            if reply_stream is not None:
+                visible = reply_stream.feed(delta)
+                if visible:
+                    ui.stream_delta(visible)
+                continue
+
+            # wait until we know whether the message starts with the prefix
+            if len(response_message) < len(prefix) and prefix.startswith(response_message):
+                continue
+            if response_message.startswith(prefix):
+                start, end = len(prefix) + shown, len(response_message) - 2
+            else:
+                start, end = shown, len(response_message)
+            if end > start:
+                ui.stream_delta(response_message[start:end])
+                shown += end - start
+
+        return response_message
+
+    def parse_structured_reply(response_message):
+        """Return {"target": ..., "content": ...} for a structured reply, None if it is not valid."""
+        try:
+            reply = json.loads(response_message)
+        except (TypeError, ValueError):
+            return None
+        if not isinstance(reply, dict) or reply.get("target") not in ("user", "shell", "empty"):
+            return None
+        content = reply.get("content")
+        if not isinstance(content, str):
+            return None
+        if reply["target"] != "empty" and not content.strip():
+            reply["target"] = "empty"
+        return {"target": reply["target"], "content": content}
+
+    def generate_forwarding_decision(forwarding_chat_history, client, ui):
+        model = ui.selected_model
+        ui.debug_log(f"Forwarding decision ({model})...")
+        with tracer.span("forwarding", model=model) as span:
+            response = client.chat.completions.create(
+                model=model,
+                messages=forwarding_chat_history
+            )
+
         response_message = response.choices[0].message.content
-        gui_handler.debug_log(f"Forwarding decision = \"{response_message}\" ({time.time()-t:.2f}s)")
+        ui.debug_log(f"Forwarding decision = \"{response_message}\" ({span.duration:.2f}s)")
         return response_message
 
+#-------------------------------------------------------
+# Local forwarding decision
+#-------------------------------------------------------
+
+class ForwardingClassifier:
+    """Decides locally whether an AI reply is PowerShell code or a message for the user.
+    Only replies it is not confident about are sent to the forwarding agent, and all
+    decisions are kept in a small LRU cache keyed by the hash of the reply."""
+
+    # standard PowerShell verbs (Get-Verb)
+    APPROVED_VERBS = {
+        "add", "approve", "assert", "backup", "block", "build", "checkpoint", "clear", "close",
+        "compare", "complete", "compress", "confirm", "connect", "convert", "convertfrom",
+        "convertto", "copy", "debug", "deny", "deploy", "disable", "disconnect", "dismount",
+        "edit", "enable", "enter", "exit", "expand", "export", "find", "format", "get", "grant",
+        "group", "hide", "import", "initialize", "install", "invoke", "join", "limit", "lock",
+        "measure", "merge", "mount", "move", "new", "open", "optimize", "out", "ping", "pop",
+        "protect", "publish", "push", "read", "receive", "redo", "register", "remove", "rename",
+        "repair", "request", "reset", "resize", "resolve", "restart", "restore", "resume",
+        "revoke", "save", "search", "select", "send", "set", "show", "skip", "sort", "split",
+        "start", "step", "stop", "submit", "suspend", "switch", "sync", "test", "trace",
+        "unblock", "undo", "uninstall", "unlock", "unprotect", "unpublish", "unregister",
+        "update", "use", "wait", "watch", "where", "write"
+    }
+    # aliases and native programs that are commonly used by the assistant
+    COMMON_COMMANDS = {
+        "cd", "chdir", "ls", "dir", "gci", "gc", "gi", "gp", "gps", "gsv", "ps", "pwd", "sl",
+        "echo", "cat", "type", "cp", "copy", "cpi", "mv", "move", "mi", "rm", "del", "erase",
+        "ri", "rd", "rmdir", "md", "mkdir", "ni", "ii", "iwr", "irm", "iex", "cls", "clear",
+        "kill", "spps", "sort", "select", "foreach", "where", "ft", "fl", "ren", "start",
+        "saps", "ipconfig", "ping", "tasklist", "taskkill", "shutdown", "netsh", "netstat",
+        "winget", "choco", "git", "python", "py", "pip", "notepad", "calc", "explorer",
+        "systeminfo", "hostname", "whoami", "wmic", "powercfg", "sfc", "dism", "reg", "net",
+        "nslookup", "tracert", "curl", "wget", "msiexec", "cmd", "code", "control", "mstsc"
+    }
+    VERB_NOUN = re.compile(r"^([A-Za-z]+)-([A-Za-z][A-Za-z0-9]*)$")
+    KEYWORD = re.compile(r"^(if|elseif|else|foreach|for|while|do|switch|function|filter|try|catch|finally|param|begin|process|end)\s*[({]", re.IGNORECASE)
+    OPERATOR = re.compile(r"\|\s*[A-Za-z%?]|\$[A-Za-z_{(]|::|;\s*$|^[&.]\s*[\\/.'\"$]|^[\[{}]|^\.\\")
+    SENTENCE_END = re.compile(r"[.?!]['\")]*$")
+    # what makes "name ..." a command and not prose: a parameter, a path or file name, or an operator
+    COMMAND_SYNTAX = re.compile(r"\s[-/][A-Za-z?]|[\\/:~*]|\.[A-Za-z0-9]{1,4}(\s|$)|[|&;=<>]")
+
+    def __init__(self, ui):
+        self.ui = ui
+        self.known_commands = set(self.COMMON_COMMANDS)
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+        self.fallbacks = 0
+
+    def load_known_commands(self, cache_file, shell):
+        """Extend the known command names with the ones installed on this machine.
+        The list is read from cache_file, or queried from PowerShell and saved there if the file is
+        missing or older than KNOWN_COMMANDS_MAX_AGE (a stale list is still used if the query fails)."""
+        names = None
+        fresh = os.path.exists(cache_file) and time.time() - os.path.getmtime(cache_file) < KNOWN_COMMANDS_MAX_AGE
+        if not fresh:
+            try:
+                names = shell.list_known_commands()
+            except Exception as e:
+                print(f"Could not query PowerShell commands: {e}")
+            if names:
+                os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+                with open(cache_file, "w", encoding="utf-8") as f:
+                    f.write("\n".join(names))
+        if not names and os.path.exists(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as f:
+                names = f.read().split()
+        if names:
+            self.known_commands |= {name.lower() for name in names}
+
+    def _score_line(self, line):
+        """Return ("shell" | "user" | None, strength) for a single line of the reply."""
+        line = line.strip()
+        if not line or line.startswith("#"):
+            return None, 0.0
+        words = line.split()
+        first = re.split(r"[\s(;|]", line, maxsplit=1)[0]
+        # commands rarely are four words or more ending like a sentence without a pipe or variable
+        sentence = len(words) >= 4 and self.SENTENCE_END.search(line) is not None and not re.search(r"[|$]", line)
+
+        verb_noun = self.VERB_NOUN.match(first)
+        if (verb_noun and verb_noun.group(1).lower() in self.APPROVED_VERBS) or self.KEYWORD.match(line) or self.OPERATOR.search(line):
+            # prose about a cmdlet ("Remove-Item deletes files.") is left to the forwarding agent
+            if sentence:
+                return "user", 0.5
+            return "shell", 1.0
+        if first.lower() in self.known_commands:
+            # an alias at the start of a normal sentence ("Start by ...", "Where do ...?") is still prose
+            if sentence:
+                return "user", 1.0
+            # without any command syntax ("Help me", "where is it") the forwarding agent decides
+            if self.COMMAND_SYNTAX.search(line[len(first):]):
+                return "shell", 0.95
+            return "shell", 0.6
+        if sentence:
+            return "user", 1.0
+        if len(words) >= 3:
+            return "user", 0.6
+        return None, 0.0
+
+    def classify(self, message):
+        """Return (answer_type, confidence) for a reply, answer_type is None if nothing is known."""
+        if not message or not message.strip():
+            return "empty", 1.0
+        if message.lstrip().startswith("talk_to_user("):
+            return "user", 1.0
+
+        scores = {"shell": 0.0, "user": 0.0}
+        strongest = {"shell": 0.0, "user": 0.0}
+        for line in message.splitlines():
+            kind, strength = self._score_line(line)
+            if kind:
+                scores[kind] += strength
+                strongest[kind] = max(strongest[kind], strength)
+
+        winner = max(scores, key=scores.get)
+        loser = "user" if winner == "shell" else "shell"
+        if scores[winner] == 0:
+            return None, 0.0
+        # agreement between the lines, scaled by the best evidence for the winner
+        agreement = (scores[winner] - scores[loser]) / (scores[winner] + scores[loser])
+        return winner, agreement * strongest[winner]
+
+    def decide(self, message, fallback):
+        """Return the forwarding decision for message. fallback(message) is called when the
+        local classifier is below FORWARDING_CLASSIFIER_THRESHOLD."""
+        key = hashlib.blake2b(message.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            self.lookups += 1
+            answer_type = self._cache.get(key)
+            if answer_type is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+
+        if answer_type is not None:
+            source = "cache"
+        else:
+            answer_type, confidence = self.classify(message)
+            source = f"local, {confidence:.2f}"
+            if answer_type is None or confidence < FORWARDING_CLASSIFIER_THRESHOLD:
+                answer_type = fallback(message)
+                source = "model"
+                with self._lock:
+                    self.fallbacks += 1
+            if answer_type in ("user", "shell", "empty"):
+                with self._lock:
+                    self._cache[key] = answer_type
+                    if len(self._cache) > FORWARDING_CACHE_SIZE:
+                        self._cache.popitem(last=False)
+
+        self.ui.debug_log(f"Forwarding decision = \"{answer_type}\" ({source}) | {self.stats()}")
+        return answer_type
+
+    def stats(self):
+        lookups = max(self.lookups, 1)
+        return (f"cache hit rate {self.hits/lookups*100:.1f}% ({self.hits}/{self.lookups}), "
+                f"fallback rate {self.fallbacks/lookups*100:.1f}% ({self.fallbacks}/{self.lookups})")
+
+#-------------------------------------------------------
+# Session journal
+#-------------------------------------------------------
+
+class SessionJournal:
+    """Append-only JSONL journal of the chat history. Records are written by a background
+    thread so that logging never blocks the pipeline, full files are rotated and gzip-compressed.
+    A journal can be replayed to resume the last session."""
+
+    def __init__(self, log_path, resume=False):
+        self.log_path = log_path
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+        self.resumed_messages = []
+        if resume:
+            last_session = SessionJournal.find_last_session(log_path)
+            if last_session:
+                # keep writing into the resumed session so it can be resumed again later
+                self.session = last_session
+                self.resumed_messages = SessionJournal.replay(log_path, last_session)
+        self.file_path = os.path.join(log_path, f"session_{self.session}.jsonl")
+        self._part = len(SessionJournal.session_parts(log_path, self.session))
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def message(self, role, content):
+        self._queue.put({"ts": round(time.time(), 3), "type": "message", "role": role, "content": content})
+
+    def reset(self):
+        self._queue.put({"ts": round(time.time(), 3), "type": "reset"})
+
+    def flush(self, timeout=None):
+        """Block until everything recorded so far is written to disk."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _writer(self):
+        journal_file = None
+        while True:
+            # take everything that is queued, so one write covers the whole batch
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = [json.dumps(item, ensure_ascii=False) + "\n" for item in batch if isinstance(item, dict)]
+            if lines:
+                if journal_file is None:
+                    os.makedirs(self.log_path, exist_ok=True)
+                    journal_file = open(self.file_path, "a", encoding="utf-8")
+                journal_file.write("".join(lines))
+                journal_file.flush()
+                if journal_file.tell() > JOURNAL_MAX_BYTES:
+                    journal_file.close()
+                    journal_file = None
+                    self._rotate()
+
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if None in batch:
+                if journal_file is not None:
+                    journal_file.close()
+                return
+
+    def _rotate(self):
+        """Compress the full journal file into the next numbered part and start a new one."""
+        self._part += 1
+        part_path = os.path.join(self.log_path, f"session_{self.session}.part{self._part:03d}.jsonl.gz")
+        with open(self.file_path, "rb") as source, gzip.open(part_path, "wb") as target:
+            shutil.copyfileobj(source, target)
+        os.remove(self.file_path)
+
+    @staticmethod
+    def session_parts(log_path, session):
+        """Return the compressed parts of a session in write order."""
+        if not os.path.isdir(log_path):
+            return []
+        prefix = f"session_{session}.part"
+        return sorted(name for name in os.listdir(log_path) if name.startswith(prefix) and name.endswith(".jsonl.gz"))
+
+    @staticmethod
+    def find_last_session(log_path):
+        if not os.path.isdir(log_path):
+            return None
+        sessions = [match.group(1) for match in (re.match(r"session_(\d{8}-\d{6})\.", name) for name in os.listdir(log_path)) if match]
+        return max(sessions) if sessions else None
+
+    @staticmethod
+    def replay(log_path, session):
+        """Return the messages of a session since its last reset."""
+        messages = []
+        files = [gzip.open(os.path.join(log_path, name), "rt", encoding="utf-8") for name in SessionJournal.session_parts(log_path, session)]
+        current_path = os.path.join(log_path, f"session_{session}.jsonl")
+        if os.path.exists(current_path):
+            files.append(open(current_path, "r", encoding="utf-8"))
+        for journal_file in files:
+            with journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut off by a crash
+                    if record.get("type") == "reset":
+                        messages = []
+                    elif record.get("type") == "message":
+                        messages.append({"role": record["role"], "content": record["content"]})
+        return messages
+
+#-------------------------------------------------------
+# Chat history with token accounting
+#-------------------------------------------------------
+
+class ChatHistory(list):
+    """List of chat messages that encodes every message only once and keeps a running
+    token total, so the context usage never requires re-encoding the whole history."""
+
+    # fixed overhead of the chat format (see the OpenAI cookbook on counting tokens)
+    TOKENS_PER_MESSAGE = 3
+    TOKENS_PER_REPLY = 3
+
+    def __init__(self, messages=()):
+        super().__init__(messages)
+        self._model = None
+        self._counts = None # per message, None until counted or after a change that was not tracked
+        self._total = 0
+
+    def append(self, message):
+        super().append(message)
+        # only count right away once the model is known, token_count catches up otherwise
+        if self._model is not None and self._counts is not None:
+            count = ChatHistory.count_message(message, self._model)
+            self._counts.append(count)
+            self._total += count
+
+    def replace_range(self, start, end, messages):
+        """Replace self[start:end] by messages, only the new messages are encoded."""
+        super().__setitem__(slice(start, end), messages)
+        if self._model is not None and self._counts is not None:
+            counts = [ChatHistory.count_message(message, self._model) for message in messages]
+            self._total += sum(counts) - sum(self._counts[start:end])
+            self._counts[start:end] = counts
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            super().__setitem__(index, value)
+            self._counts = None
+            return
+        super().__setitem__(index, value)
+        if self._model is not None and self._counts is not None:
+            count = ChatHistory.count_message(value, self._model)
+            self._total += count - self._counts[index]
+            self._counts[index] = count
+
+    # every other change makes token_count encode the history again
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._counts = None
+
+    def __iadd__(self, messages):
+        self._counts = None
+        return super().__iadd__(messages)
+
+    def __imul__(self, times):
+        self._counts = None
+        return super().__imul__(times)
+
+    def insert(self, index, message):
+        super().insert(index, message)
+        self._counts = None
+
+    def extend(self, messages):
+        super().extend(messages)
+        self._counts = None
+
+    def pop(self, index=-1):
+        self._counts = None
+        return super().pop(index)
+
+    def remove(self, message):
+        super().remove(message)
+        self._counts = None
+
+    def clear(self):
+        super().clear()
+        self._counts = None
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._counts = None
+
+    def reverse(self):
+        super().reverse()
+        self._counts = None
+
+    def message_tokens(self, index):
+        """Tokens of a single message, valid after token_count was called."""
+        return self._counts[index]
+
+    def token_count(self, model):
+        """Return the prompt tokens the api bills for sending this history to model."""
+        if model != self._model or self._counts is None:
+            # first call, model switch or a change that was not counted on the way
+            self._model = model
+            self._counts = [ChatHistory.count_message(message, model) for message in self]
+            self._total = sum(self._counts)
+        return self._total + ChatHistory.TOKENS_PER_REPLY
+
+    @staticmethod
+    def count_message(message, model):
+        encoding = PromptHandler.encoding_for_model(model)
+        count = ChatHistory.TOKENS_PER_MESSAGE
+        for value in message.values():
+            count += len(encoding.encode(value, disallowed_special=()))
+        return count
+
+#-------------------------------------------------------
+# Context window management
+#-------------------------------------------------------
+
+class ContextManager:
+    """Keeps the chat history within the token budget of the selected model. Instead of wiping the
+    history, it first elides PowerShell outputs the model has already answered to, then replaces
+    older turns by a summary. The system prompt and the most recent messages are never touched."""
+
+    SUMMARY_PREFIX = "SUMMARY OF THE EARLIER CONVERSATION: \n"
+    SUMMARY_PROMPT = ("Summarize the following conversation between a user, an AI assistant that controls "
+                      "PowerShell and the PowerShell output. Keep every fact that may be needed later "
+                      "(paths, names, settings, results, open questions) and drop everything else. "
+                      "Answer with at most 200 words.")
+
+    def __init__(self, ui):
+        self.ui = ui
+
+    def budget(self, model):
+        """Tokens a prompt may use for model, leaving room for the reply."""
+        window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+        return min(CONTEXT_TOKEN_BUDGET, window - MODEL_MAX_TOKENS)
+
+    def fit(self, chat_history, model):
+        """Compact chat_history in place if it is above CONTEXT_COMPACT_AT of the budget. Returns
+        False if even the recent messages don't fit, then the caller has to start over."""
+        budget = self.budget(model)
+        limit = int(budget * CONTEXT_COMPACT_AT)
+        used = chat_history.token_count(model)
+        if used <= limit:
+            return True
+        self.ui.debug_log(f"Context at {used} / {budget} tokens, compacting...")
+        protected_from = max(len(chat_history) - CONTEXT_KEEP_RECENT, 1)
+
+        # 1. shell outputs the model already reacted to are not needed in full anymore
+        elided = 0
+        for index in range(1, protected_from):
+            message = chat_history[index]
+            if message["role"] != "system" or message["content"].startswith(ContextManager.SUMMARY_PREFIX):
+                continue
+            if chat_history[index + 1]["role"] != "assistant":
+                continue
+            tokens = chat_history.message_tokens(index)
+            if tokens <= CONTEXT_ELIDE_MIN_TOKENS:
+                continue
+            first_line = message["content"].strip().split("\n", 1)[0][:200]
+            chat_history.replace_range(index, index + 1, [{
+                "role": "system",
+                "content": f"[PowerShell output of {tokens} tokens elided after it was used. First line: {first_line}]"
+            }])
+            elided += 1
+            used = chat_history.token_count(model)
+            if used <= limit:
+                break
+        if elided:
+            self.ui.debug_log(f"Elided {elided} used shell outputs, context at {used} tokens")
+
+        # 2. older turns are replaced by a summary
+        if used > limit and protected_from > 1:
+            with tracer.span("summary", messages=protected_from - 1):
+                summary = ContextManager.summarise(chat_history[1:protected_from], model, self.ui)
+            chat_history.replace_range(1, protected_from, [{
+                "role": "system",
+                "content": ContextManager.SUMMARY_PREFIX + summary
+            }])
+            used = chat_history.token_count(model)
+            self.ui.debug_log(f"Summarised {protected_from - 1} older messages, context at {used} tokens")
+            self.ui.print_text("SYSTEM INFO: \nOlder messages were summarised to stay within the context window.\n\n", TEXT_COLOR_SETTINGS)
+
+        # 3. only if the recent messages alone are too big, the caller starts over
+        return used <= budget
+
+    @staticmethod
+    def summarise(messages, model, ui):
+        """Summarise messages with the model, if that fails keep the user requests as summary."""
+        conversation = "\n".join(f"{message['role']}: {message['content'][:2000]}" for message in messages)
+        try:
+            response = openai_handler.OpenAiClient.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": ContextManager.SUMMARY_PROMPT},
+                    {"role": "user", "content": conversation}
+                ]
+            )
+            summary = response.choices[0].message.content
+            if summary:
+                return summary
+        except Exception as e:
+            ui.debug_log(f"Summary failed, keeping the user requests instead: {e}")
+        requests = [message["content"][:300] for message in messages if message["role"] == "user"]
+        return "Earlier requests of the user: " + " | ".join(requests)
+
 #-------------------------------------------------------
 # Transfer prompts between pipes
 #-------------------------------------------------------
 
 class PromptHandler:
 
-    def __init__(self):
+    def __init__(self, ui):
+        self.ui = ui
         # default settings for toggle buttons
         self.ask_for_execution = True
         self.follow_up_questions = True
         self.speech_output_enabled = True
         self.listen_to_keys = False
-        self.pressed_key = None
-        self.key_is_caught = False
+        # the key handlers hand the key the pipeline waits for over through this queue
+        self.pressed_keys = queue.Queue()
         self.current_token_use = 0
         self.last_ai_response = None
+        # decides obvious forwarding cases without an api call
+        self.forwarding_classifier = ForwardingClassifier(ui)
+        # keeps the history within the context window of the model
+        self.context_manager = ContextManager(ui)
         # globally accessible chat history
-        self.chat_history = [
+        self.chat_history = ChatHistory([
             {
                 "role": "system",
-                "content": PromptHandler.get_preprompt()
+                "content": PromptHandler.get_preprompt(ui)
             }
-        ]
+        ])
 
-    def get_preprompt():
-        full_path = os.path.join(gui_handler.files_path, "pre_prompt_shell.txt")
+    def get_preprompt(ui):
+        full_path = os.path.join(ui.files_path, "pre_prompt_shell.txt")
         with open(full_path, "r") as f:
             preprompt = f.read()
+        # structured replies need the answer format on top of the normal instructions
+        if RESPONSE_MODE == "structured":
+            full_path = os.path.join(ui.files_path, "pre_prompt_structured.txt")
+            with open(full_path, "r") as f:
+                preprompt += f.read()
         return preprompt
 
-    def get_forwarding_prompt():
-        full_path = os.path.join(gui_handler.files_path, "pre_prompt_forwarder.txt")
+    def get_forwarding_prompt(ui):
+        full_path = os.path.join(ui.files_path, "pre_prompt_forwarder.txt")
         with open(full_path, "r") as f:
             forwarding_prompt = f.read()
         return forwarding_prompt
 
-    def reset_chat_history():
+    def reset_chat_history(ui):
 
         # reset last ai response
         prompt_handler.last_ai_response = None
+        session_journal.reset()
 
         # reset the chat history
-        chat_history = [
+        chat_history = ChatHistory([
             {
                 "role": "system",
-                "content": PromptHandler.get_preprompt()
+                "content": PromptHandler.get_preprompt(ui)
             }
-        ]
+        ])
         return chat_history
     
     def add_to_chat_history(message, role):
@@ -1518,18 +3369,28 @@ class PromptHandler:
             "role": role,
             "content": message
         })
-
-    # analyze the response from the llm and check if it is a shell command or a user message
-    # we create a second agent that takes care of the forwarding decision
-    def forward_by_ai(response_message):
+        session_journal.message(role, message)
+
+    # rebuild the chat history of a resumed session and show the conversation again
+    def resume_chat_history(messages, ui):
+        for message in messages:
+            prompt_handler.chat_history.append(message)
+            if message["role"] == "user":
+                ui.print_text(f"USER: \n{message['content']}\n\n", TEXT_COLOR_USER)
+            elif message["role"] == "assistant":
+                ui.print_text(f"AI: \n{message['content']}\n\n", TEXT_COLOR_AI)
+        ui.print_text(f"SYSTEM INFO: \nResumed last session with {len(messages)} messages.\n\n", TEXT_COLOR_SETTINGS)
+
+    # ask the second agent whether the message is meant for the shell or for the user
+    def ask_forwarding_agent(response_message, ui):
         # create a new chat history with the forwarding prompt
         forwarding_chat_history = [
             {
                 "role": "system",
-                "content": PromptHandler.get_forwarding_prompt()
+                "content": PromptHandler.get_forwarding_prompt(ui)
             }
         ]
-        
+
         # add the last message to the forwarding chat history
         forwarding_chat_history.append({
             "role": "user",
@@ -1537,7 +3398,23 @@ class PromptHandler:
         })
 
         # create a completion of the existing conversation, the agent will either answer "shell" or "user"
-        answer_type = OpenAiHandler.generate_forwarding_decision(forwarding_chat_history, openai_handler.OpenAiClient)
+        return OpenAiHandler.generate_forwarding_decision(forwarding_chat_history, openai_handler.OpenAiClient, ui)
+
+    # show an ai message in the conversation view, either by replacing the already streamed block or with the typewriter
+    def show_ai_message(text, color, streamed, ui, on_complete=None):
+        if streamed:
+            ui.end_stream(text, color, on_complete=on_complete)
+        else:
+            ui.print_text_typewriter(text, color, on_complete=on_complete)
+
+    # analyze the response from the llm and check if it is a shell command or a user message
+    # we create a second agent that takes care of the forwarding decision
+    # streamed is True if the response was already rendered live by OpenAiHandler.stream_AI_response
+    # answer_type is already known for structured replies, otherwise the forwarding agent decides
+    def forward_by_ai(response_message, ui, streamed=False, answer_type=None):
+        if answer_type is None:
+            # obvious cases are decided locally, only unclear ones go to the forwarding agent
+            answer_type = prompt_handler.forwarding_classifier.decide(response_message, functools.partial(PromptHandler.ask_forwarding_agent, ui=ui))
 
         # if the ai response is for the user, print it to the user Interace 
         if answer_type == "user":
@@ -1550,16 +3427,15 @@ class PromptHandler:
             PromptHandler.add_to_chat_history(clean_message, "assistant")
 
             # Compute token stats now, but display them after the typewriter finishes
-            token_use = PromptHandler.num_tokens_from_string(str(prompt_handler.chat_history), 'cl100k_base') #cl100k_base #p50k_base
+            token_use = prompt_handler.chat_history.token_count(ui.selected_model)
             prompt_handler.current_token_use = token_use
-            token_max = 16384
-            PromptHandler.save_chat_history(prompt_handler.chat_history)
+            token_max = prompt_handler.context_manager.budget(ui.selected_model)
 
             # Start TTS in a separate thread so it plays parallel to the typewriter
             if prompt_handler.speech_output_enabled:
                 threading.Thread(
-                    target=SoundHandler.text_to_speech,
-                    args=(clean_message, openai_handler.OpenAiClient, sound_handler.voice_agent),
+                    target=tracer.bind(SoundHandler.text_to_speech),
+                    args=(clean_message, openai_handler.OpenAiClient, sound_handler.voice_agent, ui),
                     daemon=True
                 ).start()
 
@@ -1568,13 +3444,10 @@ class PromptHandler:
             typewriter_done = threading.Event()
 
             def _after_typewriter():
-                gui_handler.print_text(f"SYSTEM INFO: \nTokens used: {token_use} / {token_max} ({round(token_use/token_max*100, 2)} %)\n\n", TEXT_COLOR_SETTINGS)
-                if token_use > token_max-2000:
-                    prompt_handler.chat_history = PromptHandler.reset_chat_history()
-                    gui_handler.print_text(f"SYSTEM INFO: \nMaximum number of tokens reached, chat history reset.\n\n", TEXT_COLOR_SETTINGS)
+                ui.print_text(f"SYSTEM INFO: \nTokens used: {token_use} / {token_max} ({round(token_use/token_max*100, 2)} %)\n\n", TEXT_COLOR_SETTINGS)
                 typewriter_done.set()
 
-            gui_handler.print_text_typewriter(f"AI TO USER: \n{clean_message}\n\n", TEXT_COLOR_AI, on_complete=_after_typewriter)
+            PromptHandler.show_ai_message(f"AI TO USER: \n{clean_message}\n\n", TEXT_COLOR_AI, streamed, ui, on_complete=_after_typewriter)
 
             # Wait for typewriter + system info to complete before pipeline returns
             typewriter_done.wait()
@@ -1582,112 +3455,553 @@ class PromptHandler:
 
         # if the ai response is a command, forward it to the shell handler
         elif answer_type == "shell":
+            startup_handler.wait("PowerShell")
             # check if prompt handler is in "Ask Before Execution" mode
             if prompt_handler.ask_for_execution:
-                #gui
-                # Show proposal with typewriter, then prompt for approval after it finishes
-                proposal_done = [False]
-                def _show_yn_prompt():
-                    gui_handler.print_text("SYSTEM INFO: \nLet through? (y/n): \n", TEXT_COLOR_SETTINGS)
-                    proposal_done[0] = True
-                gui_handler.print_text_typewriter(f"AI PROPOSAL: \n{response_message}\n\n", TEXT_COLOR_AI_PROPOSAL, on_complete=_show_yn_prompt)
-
-                # Wait for typewriter to finish before listening for keys
-                while not proposal_done[0]:
-                    time.sleep(0.05)
-
-                # Wait for user key press (already on background thread, so this won't freeze the UI)
-                gui_handler.debug_log("Waiting for user approval (y/n)...")
-                prompt_handler.listen_to_keys = True
-                prompt_handler.key_is_caught = False
-                while prompt_handler.pressed_key is None and prompt_handler.key_is_caught is False:
-                    time.sleep(0.1)
-
-                key = prompt_handler.pressed_key
-                prompt_handler.listen_to_keys = False
-                prompt_handler.pressed_key = None
-                prompt_handler.key_is_caught = False
-
-                if key == "y" or key == "Y" or key == "\r":
-                    gui_handler.debug_log("User approved shell execution")
+                # the user interface shows the proposal and asks for approval
+                if ui.confirm_execution(response_message, streamed):
+                    ui.debug_log("User approved shell execution")
                     PromptHandler.add_to_chat_history(response_message, "assistant")
-                    shell_handler.execute(response_message)
+                    shell_pool.execute(response_message)
 
                     # give power shell answer back to the ai (this could create a loop)
-                    OpenAiHandler.generate_AI_response(prompt_handler.chat_history, openai_handler.OpenAiClient)
+                    OpenAiHandler.generate_AI_response(prompt_handler.chat_history, openai_handler.OpenAiClient, ui)
                 else:
-                    gui_handler.debug_log("User blocked shell execution")
-                    gui_handler.print_text("SYSTEM INFO: \nShell execution blocked by user due to security issues.\n\n", TEXT_COLOR_SETTINGS)
+                    ui.debug_log("User blocked shell execution")
+                    ui.print_text("SYSTEM INFO: \nShell execution blocked by user due to security issues.\n\n", TEXT_COLOR_SETTINGS)
                     PromptHandler.add_to_chat_history(response_message, "assistant")
-                    PromptHandler.save_chat_history(prompt_handler.chat_history)
 
             else:  # if not in ask for execution mode - forward everything to the shell
-                gui_handler.print_text_typewriter(f"AI CODE: \n{response_message}\n\n", TEXT_COLOR_AI)
+                PromptHandler.show_ai_message(f"AI CODE: \n{response_message}\n\n", TEXT_COLOR_AI, streamed, ui)
                 PromptHandler.add_to_chat_history(response_message, "assistant")
-                shell_handler.execute(response_message)
+                shell_pool.execute(response_message)
                 
                 # give power shell answer back to the ai (this could create a loop)
-                response_message = OpenAiHandler.generate_AI_response(prompt_handler.chat_history, openai_handler.OpenAiClient)
+                response_message = OpenAiHandler.generate_AI_response(prompt_handler.chat_history, openai_handler.OpenAiClient, ui)
 
         elif answer_type == "empty": # if the ai response is none, then do nothing
-            gui_handler.print_text(f"SYSTEM INFO: \nModel created empty reply message for the user.\n\n", TEXT_COLOR_SETTINGS)
+            if streamed:
+                ui.end_stream()
+            ui.print_text(f"SYSTEM INFO: \nModel created empty reply message for the user.\n\n", TEXT_COLOR_SETTINGS)
         else: # if the ai response is neither, then print a warning
-            gui_handler.print_text(f"SYSTEM INFO: \nDebug Warning: The forwarding decision is neither 'shell' nor 'user' but {answer_type}.\n\n", TEXT_COLOR_SETTINGS)
+            if streamed:
+                ui.end_stream()
+            ui.print_text(f"SYSTEM INFO: \nDebug Warning: The forwarding decision is neither 'shell' nor 'user' but {answer_type}.\n\n", TEXT_COLOR_SETTINGS)
 
     
-    # save current message stream to a txt file, give it the current date and time as name
-    def save_chat_history(chat_history):
-        current_time = time.strftime("%d.%m.%Y-%Hh%Mm%Ss")
-        # ensure logs directory exists and build absolute target path
-        base_path = os.getcwd()
-        logs_dir = os.path.join(base_path, "logs")
-        os.makedirs(logs_dir, exist_ok=True)
-        log_path = os.path.join(logs_dir, f"chat_history_{current_time}.txt")
-
-        # save as txt file in utf8 for compatibility with other languages
-        with open(log_path, "w", encoding="utf-8") as f:
-            # transform list of dictionaries into string
-            chat_history_string = ""
-            for item in chat_history:
-                role = item["role"]
-                text = item["content"]
-                chat_history_string += f"\n{role}: {text}\n"
-            f.write(chat_history_string)
-    
     # count the number of tokens in a string
     def num_tokens_from_string(string: str, encoding_name: str) -> int:
-        encoding = tiktoken.get_encoding(encoding_name)
-        num_tokens = len(encoding.encode(string))
+        encoding = PromptHandler.get_encoding(encoding_name)
+        num_tokens = len(encoding.encode(string, disallowed_special=()))
         return num_tokens
 
+    # count the number of tokens in a string with the tokenizer of the given model
+    def num_tokens_for_model(string: str, model: str) -> int:
+        encoding = PromptHandler.encoding_for_model(model)
+        return len(encoding.encode(string, disallowed_special=()))
+
+    # tokenizers are expensive to look up, so each one is only loaded once
+    @functools.lru_cache(maxsize=None)
+    def get_encoding(encoding_name):
+        return tiktoken.get_encoding(encoding_name)
+
+    @functools.lru_cache(maxsize=None)
+    def encoding_for_model(model):
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return PromptHandler.get_encoding(DEFAULT_TOKEN_ENCODING)
+
+#-------------------------------------------------------
+# Request pipeline
+#-------------------------------------------------------
+
+class Pipeline:
+    """One request from the user input to the answer: speech-to-text, chat completion, forwarding,
+    PowerShell and text-to-speech. It does not know the user interface, all output goes through
+    the active UI adapter."""
+
+    def __init__(self, ui):
+        self.ui = ui
+
+    def new_request(self):
+        # if follow up questions are enabled, then do not reset the chat history
+        if not prompt_handler.follow_up_questions:
+            prompt_handler.chat_history = PromptHandler.reset_chat_history(self.ui)
+
+    def run(self, user_input=None, recording=None, echo_input=True):
+        """Run the pipeline for user_input (or a recording from SoundHandler.stop_recording). Errors are
+        shown to the user instead of being raised."""
+        try:
+            with tracer.pipeline() as span:
+                self.ui.debug_log("Pipeline started")
+                startup_handler.wait("OpenAI")
+
+                if recording is not None:
+                    with tracer.span("stt final"):
+                        user_input = SoundHandler.transcribe(recording, openai_handler.OpenAiClient, self.ui)
+                    if not user_input:
+                        self.ui.print_text("SYSTEM INFO: \nNo speech detected\n\n", TEXT_COLOR_SETTINGS)
+                        return
+
+                if echo_input:
+                    self.ui.print_text(f"USER: \n{user_input}\n\n", TEXT_COLOR_USER)
+                PromptHandler.add_to_chat_history(user_input, "user")
+
+                OpenAiHandler.generate_AI_response(prompt_handler.chat_history, openai_handler.OpenAiClient, self.ui)
+
+            self.ui.debug_log(f"Pipeline finished. Total: {span.duration:.2f}s")
+            self.ui.debug_log(f"Latency per stage:\n{tracer.summary()}")
+        except Exception as e:
+            self.ui.debug_log(f"ERROR: {e}")
+            self.ui.print_text(f"SYSTEM ERROR: \n{e}\n\n", TEXT_COLOR_POWER_SHELL)
+
+#-------------------------------------------------------
+# Batch mode
+#-------------------------------------------------------
+
+class BatchRunner:
+    """Runs many independent requests at once, each in a conversation of its own, with at most
+    concurrency of them talking to the api at the same time. Commands the model proposes are only
+    executed with execute (each conversation then gets a PowerShell session of the pool). Results
+    are written as JSON lines in the order the conversations finish."""
+
+    def __init__(self, ui, output, concurrency=BATCH_CONCURRENCY, execute=False):
+        self.ui = ui
+        self.output = output
+        self.concurrency = concurrency
+        self.execute = execute
+        self.model = self.ui.selected_model
+        self.client = openai.AsyncOpenAI(api_key=os.environ[OPEN_AI_API_KEY_ENV_VARIABLE])
+        # created in run, it belongs to the event loop
+        self.semaphore = None
+
+    @staticmethod
+    def read_requests(source):
+        """Return (id, request) for every line of source ("-" for stdin). A line is either the request
+        itself or a JSON object with "request" and an optional "id", empty lines and # comments are skipped."""
+        file = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+        requests = []
+        try:
+            for number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        data = None
+                    if isinstance(data, dict) and "request" in data:
+                        requests.append((str(data.get("id", number)), data["request"]))
+                        continue
+                requests.append((str(number), line))
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        return requests
+
+    async def run(self, requests):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+        results = await asyncio.gather(*(self.run_conversation(request_id, request) for request_id, request in requests))
+        statuses = collections.Counter(result["status"] for result in results)
+        counts = ", ".join(f"{count} {status}" for status, count in statuses.items())
+        self.ui.print_text(f"SYSTEM INFO: \nBatch of {len(results)} requests done in {time.perf_counter()-start:.2f}s ({counts}).\n\n", TEXT_COLOR_SETTINGS)
+        return results
+
+    async def run_conversation(self, request_id, request):
+        async with self.semaphore:
+            # every conversation is a run of its own, asyncio tasks and to_thread keep them apart
+            with tracer.pipeline(request=request_id):
+                start = time.perf_counter()
+                result = {"id": request_id, "request": request, "status": None, "answer": None,
+                          "commands": [], "outputs": [], "timings": {"llm": 0.0, "shell": 0.0}, "error": None}
+                history = ChatHistory([
+                    {"role": "system", "content": PromptHandler.get_preprompt(self.ui)},
+                    {"role": "user", "content": request}
+                ])
+                session = None
+                try:
+                    for _ in range(BATCH_MAX_STEPS):
+                        # counting tokens (and maybe summarising) blocks, so it runs on a thread
+                        if not await asyncio.to_thread(prompt_handler.context_manager.fit, history, self.model):
+                            history = ChatHistory([history[0], history[-1]])
+
+                        t = time.perf_counter()
+                        target, content = await self.ask_model(history)
+                        result["timings"]["llm"] += time.perf_counter() - t
+                        history.append({"role": "assistant", "content": content})
+
+                        if target == "user":
+                            result["status"] = "answered"
+                            result["answer"] = content
+                            break
+                        if target != "shell":
+                            result["status"] = "empty"
+                            break
+                        result["commands"].append(content)
+                        if not self.execute:
+                            result["status"] = "proposed"
+                            break
+
+                        # the output goes back to the model, like in the normal pipeline
+                        t = time.perf_counter()
+                        if session is None:
+                            session = await asyncio.to_thread(shell_pool.acquire, SHELL_COMMAND_TIMEOUT)
+                            if session is None:
+                                raise RuntimeError("No free PowerShell session")
+                        output_lines = await asyncio.to_thread(session.run, content, SHELL_COMMAND_TIMEOUT, False)
+                        result["timings"]["shell"] += time.perf_counter() - t
+                        result["outputs"].append("".join(output_lines))
+                        shell_output, _ = ShellHandler.output_for_model(output_lines, self.model)
+                        history.append({"role": "system", "content": shell_output})
+                    else:
+                        result["status"] = "max_steps"
+                except Exception as e:
+                    result["status"] = "error"
+                    result["error"] = str(e)
+                    self.ui.debug_log(f"Batch request {request_id} failed: {e}")
+                finally:
+                    if session is not None:
+                        # conversations are independent, the next one must not see this one's folder or variables
+                        await asyncio.to_thread(session.reset_state)
+                        shell_pool.release(session)
+                result["timings"] = {name: round(seconds, 3) for name, seconds in result["timings"].items()}
+                result["timings"]["total"] = round(time.perf_counter() - start, 3)
+                self.output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                self.output.flush()
+                return result
+
+    async def ask_model(self, history):
+        """Return (target, content) of the next reply, target is "user", "shell" or "empty"."""
+        structured = RESPONSE_MODE == "structured"
+        extra_arguments = {"response_format": STRUCTURED_RESPONSE_FORMAT} if structured else {}
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=history,
+            **extra_arguments
+        )
+        response_message = response.choices[0].message.content or ""
+        if structured:
+            reply = OpenAiHandler.parse_structured_reply(response_message)
+            if reply is not None:
+                return reply["target"], reply["content"]
+        target = await asyncio.to_thread(
+            prompt_handler.forwarding_classifier.decide, response_message,
+            functools.partial(PromptHandler.ask_forwarding_agent, ui=self.ui))
+        if target == "user" and response_message.startswith("talk_to_user("):
+            response_message = response_message[14:-2]
+        return target, response_message
+
+#-------------------------------------------------------
+# Pipeline tracing
+#-------------------------------------------------------
+
+class Span:
+    """One timed stage, see Tracer.span. duration is set once the span is closed."""
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.start = 0.0
+        self.duration = 0.0
+
+
+class Tracer:
+    """Records nested, thread-attributed spans of every pipeline run. The spans can be exported as
+    a Chrome trace (chrome://tracing, ui.perfetto.dev) and rolling p50/p95/p99 latencies are kept
+    per stage, so it is visible whether STT, the model, forwarding, the shell or TTS is slow.
+    The current run and the open spans are kept per thread (and per asyncio task), threads that
+    work for a run get them handed over with bind."""
+
+    def __init__(self, export_path):
+        self.export_path = export_path
+        self.run_id = 0 # the last run that was started
+        self._lock = threading.Lock()
+        self._events = collections.deque(maxlen=TRACE_MAX_EVENTS)
+        self._samples = {}
+        self._thread_names = {}
+        self._context = contextvars.ContextVar("trace_context", default=(0, ())) # (run, open spans)
+        atexit.register(self.export)
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """Time the with block as stage name. Spans opened inside it (also on bound threads) are its
+        children, the current pipeline run is attached to every span."""
+        run, stack = self._context.get()
+        span = Span(name, args)
+        if stack:
+            span.args["parent"] = stack[-1].name
+        span.args["run"] = run
+        token = self._context.set((run, stack + (span,)))
+        span.start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - span.start
+            self._context.reset(token)
+            self._record(span)
+
+    @contextlib.contextmanager
+    def pipeline(self, **args):
+        """Span of a whole pipeline run, the spans inside it (also on bound threads) belong to it."""
+        with self._lock:
+            self.run_id += 1
+            run = self.run_id
+        token = self._context.set((run, ()))
+        try:
+            with self.span("pipeline", **args) as span:
+                yield span
+        finally:
+            self._context.reset(token)
+
+    def bind(self, function):
+        """Wrap function to run in the current run and below the current span, for threads and executors."""
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+    def sample(self, name, seconds):
+        """Add a latency that is not a span of its own (e.g. time to first token)."""
+        with self._lock:
+            self._samples.setdefault(name, collections.deque(maxlen=TRACE_STATS_WINDOW)).append(seconds)
+            self._events.append(self._event(name, "i", time.perf_counter(), {"seconds": round(seconds, 4), "run": self._context.get()[0]}))
+
+    def _record(self, span):
+        with self._lock:
+            self._samples.setdefault(span.name, collections.deque(maxlen=TRACE_STATS_WINDOW)).append(span.duration)
+            event = self._event(span.name, "X", span.start, span.args)
+            event["dur"] = round(span.duration * 1e6, 1)
+            self._events.append(event)
+
+    def _event(self, name, phase, start, args):
+        thread = threading.current_thread()
+        self._thread_names[thread.ident] = thread.name
+        event = {"name": name, "ph": phase, "ts": round((start - IMPORT_START) * 1e6, 1),
+                 "pid": os.getpid(), "tid": thread.ident, "args": args}
+        if phase == "i":
+            event["s"] = "t"
+        return event
+
+    def percentiles(self, name):
+        """Return (p50, p95, p99) in seconds of the recent samples of name, None without samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        # nearest rank
+        return tuple(samples[min(len(samples) - 1, int(len(samples) * q / 100))] for q in (50, 95, 99))
+
+    def summary(self):
+        """One line per stage with its latency percentiles."""
+        with self._lock:
+            names = [(name, len(samples)) for name, samples in self._samples.items()]
+        lines = []
+        for name, count in names:
+            p50, p95, p99 = self.percentiles(name)
+            lines.append(f"{name}: p50 {p50:.2f}s, p95 {p95:.2f}s, p99 {p99:.2f}s (n={count})")
+        return "\n".join(lines)
+
+    def export(self, path=None):
+        """Write the recorded spans as Chrome trace JSON and return the path (None if there is nothing
+        to write or no path)."""
+        path = path or self.export_path
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+        if not events or not path:
+            return None
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                    for tid, name in thread_names.items()]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, file)
+        return path
+
+#-------------------------------------------------------
+# Startup of the slow subsystems
+#-------------------------------------------------------
+
+class StartupHandler:
+    """Starts the slow subsystems (PowerShell, OpenAI client, audio mixer, tokenizer) on background
+    threads so that the window is usable right away. Readiness is shown in the sidebar and a
+    timing report is written to the debug panel once everything is up."""
+
+    def __init__(self, ui):
+        self.ui = ui
+        self.timings = {"imports": IMPORT_DONE - IMPORT_START}
+        self.ready = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._reported = False
+
+    def elapsed(self):
+        return time.perf_counter() - IMPORT_START
+
+    def mark(self, name):
+        """Record that a startup step has been reached."""
+        with self._lock:
+            self.timings[name] = self.elapsed()
+        self._report_if_done()
+
+    def start(self, name, target):
+        """Run target on a background thread, name becomes ready once it returned."""
+        self.ready[name] = threading.Event()
+        self.ui.set_status(name, "starting")
+
+        def run():
+            t = time.perf_counter()
+            try:
+                with tracer.span(f"startup {name}"):
+                    target()
+            except Exception as e:
+                self.errors[name] = e
+                self.ui.set_status(name, "failed")
+                self.ui.debug_log(f"{name} could not be started: {e}")
+            else:
+                self.ui.set_status(name, "ready")
+            with self._lock:
+                self.timings[name] = self.elapsed()
+                self.timings[f"{name} (own)"] = time.perf_counter() - t
+            self.ready[name].set()
+            self._report_if_done()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def is_ready(self, name):
+        return name in self.ready and self.ready[name].is_set() and name not in self.errors
+
+    def wait(self, name):
+        """Block until the subsystem is ready, raise if it could not be started."""
+        if not self.ready[name].is_set():
+            self.ui.debug_log(f"Waiting for {name}...")
+            self.ready[name].wait()
+        if name in self.errors:
+            raise RuntimeError(f"{name} could not be started: {self.errors[name]}")
+
+    def _report_if_done(self):
+        with self._lock:
+            if self._reported or "ui shown" not in self.timings:
+                return
+            if not all(event.is_set() for event in self.ready.values()):
+                return
+            self._reported = True
+            timings = dict(self.timings)
+        report = " | ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+        self.ui.debug_log(f"Startup report (seconds since start): {report}")
+
 #-------------------------------------------------------
 # Main
 #-------------------------------------------------------
 
 def main():
-    
-    # define the GUI
+    parser = argparse.ArgumentParser(description="Voice-controlled AI assistant for Windows PowerShell.")
+    parser.add_argument("--resume", action="store_true", help="continue the last session from its journal")
+    parser.add_argument("--headless", action="store_true", help="run in the terminal without a window")
+    parser.add_argument("--model", help="chat model to use instead of the default")
+    parser.add_argument("--verbose", action="store_true", help="headless: print debug and PowerShell panel output to stderr")
+    parser.add_argument("--batch", metavar="FILE", help="run the requests in FILE (- for stdin) concurrently and write JSON lines results")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="batch: conversations running at the same time")
+    parser.add_argument("--yes", action="store_true", help="batch: execute the commands the model proposes")
+    parser.add_argument("--output", help="batch: write the results to this file instead of stdout")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    headless = args.headless or args.batch is not None
+
+    # define the user interface, the Tk window or the terminal (stderr in batch mode, stdout has the results)
     global gui_handler
-    gui_handler = GuiHandler()
+    if headless:
+        gui_handler = TerminalUi(args.verbose, output=sys.stderr if args.batch else None)
+    else:
+        gui_handler = GuiHandler()
+    if args.model:
+        gui_handler.selected_model = args.model
 
-    # start connection to the powershell
-    global shell_handler
-    shell_handler = ShellHandler()
+    # spans of every pipeline run, exported as chrome trace when the app closes
+    global tracer
+    tracer = Tracer(os.path.join(gui_handler.log_path, f"trace_{time.strftime('%Y%m%d-%H%M%S')}.json"))
 
-    # start connection to the openai api
-    global openai_handler
-    openai_handler = OpenAiHandler()
+    global startup_handler
+    startup_handler = StartupHandler(gui_handler)
+    startup_handler.mark("ui built")
+
+    # every change of the chat history is journaled in the background
+    global session_journal
+    session_journal = SessionJournal(gui_handler.log_path, resume=args.resume)
 
     # start the prompt handler
     global prompt_handler
-    prompt_handler = PromptHandler()
+    prompt_handler = PromptHandler(gui_handler)
+    if session_journal.resumed_messages:
+        PromptHandler.resume_chat_history(session_journal.resumed_messages, gui_handler)
 
     # start the sound handler
     global sound_handler
-    sound_handler = SoundHandler()
+    sound_handler = SoundHandler(gui_handler)
+
+    # spoken replies are cached on disk, so repeated ones need no api call
+    global tts_cache
+    tts_cache = TtsCache(os.path.join(gui_handler.cache_path, "tts"))
+
+    # the request pipeline, the same for every user interface
+    global pipeline
+    pipeline = Pipeline(gui_handler)
+
+    # start connection to the powershell, the primary session of the pool keeps all state
+    def start_powershell():
+        global shell_pool
+        # in batch mode every running conversation gets a worker session
+        shell_pool = ShellPool(gui_handler, max(SHELL_POOL_SIZE, args.concurrency + 1) if args.batch else SHELL_POOL_SIZE)
+        # learn the command names of this machine for the local forwarding decision
+        threading.Thread(
+            target=prompt_handler.forwarding_classifier.load_known_commands,
+            args=(os.path.join(gui_handler.cache_path, KNOWN_COMMANDS_FILE), shell_pool.primary),
+            daemon=True
+        ).start()
+
+    # start connection to the openai api
+    def start_openai():
+        global openai_handler
+        openai_handler = OpenAiHandler()
+
+    # the slow subsystems start in the background while the window is already usable
+    # a batch without --yes never runs commands
+    if args.batch is None or args.yes:
+        startup_handler.start("PowerShell", start_powershell)
+    startup_handler.start("OpenAI", start_openai)
+    startup_handler.start("Tokenizer", lambda: PromptHandler.encoding_for_model(gui_handler.selected_model))
+    if headless:
+        # no speech output in the terminal, so the audio mixer is not needed
+        prompt_handler.speech_output_enabled = False
+        startup_handler.mark("ui shown")
+    else:
+        startup_handler.start("Audio", mixer.init)
+        gui_handler.root.after_idle(startup_handler.mark, "ui shown")
+
+        # common phrases are synthesised in the background once the api client is there
+        def seed_tts_cache():
+            try:
+                startup_handler.wait("OpenAI")
+                tts_cache.seed(os.path.join(gui_handler.files_path, TTS_SEED_FILE), sound_handler.voice_agent, openai_handler.OpenAiClient, gui_handler)
+            except Exception as e:
+                gui_handler.debug_log(f"TTS cache could not be seeded: {e}")
+        threading.Thread(target=seed_tts_cache, daemon=True).start()
+
+    if args.batch:
+        startup_handler.wait("OpenAI")
+        if args.yes:
+            startup_handler.wait("PowerShell")
+        output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        try:
+            asyncio.run(BatchRunner(gui_handler, output, args.concurrency, execute=args.yes).run(BatchRunner.read_requests(args.batch)))
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        return
 
-    # start the gui
-    gui_handler.start_gui()
+    # start the user interface
+    gui_handler.start()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
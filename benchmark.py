@@ -0,0 +1,420 @@
+#-------------------------------------------------------
+# Headless end-to-end benchmark of the Autoshell pipeline
+#-------------------------------------------------------
+#
+# Runs the request pipeline (Autoshell.Pipeline: speech-to-text, chat completion, forwarding,
+# PowerShell, text-to-speech) without a window, network or PowerShell:
+#   - a local HTTP server stands in for the OpenAI chat and audio endpoints (with configurable latency)
+#   - a scripted python program stands in for PowerShell
+#   - a BenchGui object replaces the Tk GUI and only records what would have been shown
+#
+# Usage (Linux):  python benchmark.py [--turns 20] [--latency 0.05] [--token-latency 0.002] [--json results.json]
+
+import argparse
+import collections
+import http.server
+import json
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import Autoshell
+
+#-------------------------------------------------------
+# Mock OpenAI server
+#-------------------------------------------------------
+
+class MockOpenAiServer(http.server.ThreadingHTTPServer):
+    """Answers /v1/chat/completions (plain and SSE streaming), /v1/audio/speech and
+    /v1/audio/transcriptions. latency is the time to the first byte, token_latency the time
+    between two streamed chunks. reply(messages) returns the content of the next chat answer."""
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.05, token_latency=0.002, chunk_chars=4):
+        super().__init__(("127.0.0.1", 0), MockOpenAiRequestHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.chunk_chars = chunk_chars
+        self.reply = lambda messages: json.dumps({"target": "user", "content": "Done."})
+        self.transcript = "What is in my home folder?"
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+
+class MockOpenAiRequestHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        number = self.server.count_request()
+        time.sleep(self.server.latency)
+        if self.path.endswith("/chat/completions"):
+            request = json.loads(body)
+            content = self.server.reply(request["messages"])
+            if request.get("stream"):
+                self.send_stream(request["model"], content, number)
+            else:
+                self.send_json({
+                    "id": f"chatcmpl-{number}", "object": "chat.completion", "created": int(time.time()),
+                    "model": request["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                })
+        elif self.path.endswith("/audio/transcriptions"):
+            self.send_json({"text": self.server.transcript})
+        elif self.path.endswith("/audio/speech"):
+            self.send_speech()
+        else:
+            self.send_error(404)
+
+    def send_json(self, data):
+        self.send_bytes(json.dumps(data).encode("utf-8"), "application/json")
+
+    def send_bytes(self, data, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, model, content, number):
+        # no content length, the end of the stream is the end of the connection
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        step = self.server.chunk_chars
+        pieces = [content[i:i + step] for i in range(0, len(content), step)]
+        for index, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if index == 0 else {"content": piece}
+            chunk = {"id": f"chatcmpl-{number}", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.token_latency)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def send_speech(self):
+        # one second of 24 kHz 16 bit pcm silence, sent in pieces like a synthesis that is still running
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/pcm")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for _ in range(12):
+            self.wfile.write(bytes(4000))
+            self.wfile.flush()
+            time.sleep(self.server.token_latency)
+
+#-------------------------------------------------------
+# Scripted PowerShell stand-in
+#-------------------------------------------------------
+
+# speaks the line protocol of ShellHandler: commands on stdin, IDENTIFIER_251223 on both streams marks the end
+FAKE_SHELL = r'''#!/usr/bin/env python3
+import os, sys, time
+lines = int(os.environ.get("FAKE_SHELL_LINES", "40"))
+delay = float(os.environ.get("FAKE_SHELL_DELAY", "0.01"))
+for line in sys.stdin:
+    command = line.strip()
+    if not command or command == "clear":
+        continue
+    if command == "echo 'IDENTIFIER_251223'":
+        print("IDENTIFIER_251223", flush=True)
+    elif command.startswith("[Console]::Error.WriteLine('IDENTIFIER_251223')"):
+        print("IDENTIFIER_251223", file=sys.stderr, flush=True)
+    elif command == "(Get-Location).Path":
+        print(os.getcwd(), flush=True)
+    elif command.startswith("Set-Location"):
+        continue
+    else:
+        time.sleep(delay)
+        for i in range(lines):
+            print(f"-a----  18.10.2026  12:00  {1000 + i:>10} file_{i}.txt", flush=False)
+        sys.stdout.flush()
+'''
+
+#-------------------------------------------------------
+# GUI stand-in
+#-------------------------------------------------------
+
+class BenchGui(Autoshell.UiAdapter):
+    """User interface adapter that only counts the output."""
+
+    def __init__(self, root_path, model):
+        super().__init__()
+        self.selected_model = model
+        self.files_path = os.path.join(root_path, "files")
+        self.log_path = os.path.join(root_path, "logs")
+        self.cache_path = os.path.join(root_path, "cache")
+        self.printed_chars = 0
+        self.errors = []
+        self.shell_chars = 0
+        # only the last messages, so the log doesn't show up as retained memory
+        self.debug_lines = collections.deque(maxlen=200)
+        self.playback_done = threading.Event()
+
+    def print_text(self, text, color):
+        self.printed_chars += len(text)
+        if text.startswith("SYSTEM ERROR"):
+            self.errors.append(text.strip())
+
+    def print_text_typewriter(self, text, color, delay=15, on_complete=None, instant=None):
+        self.print_text(text, color)
+        if on_complete:
+            on_complete()
+
+    def begin_stream(self, header, color):
+        self.printed_chars += len(header)
+
+    def stream_delta(self, delta):
+        self.printed_chars += len(delta)
+
+    def end_stream(self, text=None, color=None, on_complete=None):
+        if text:
+            self.printed_chars += len(text)
+        if on_complete:
+            on_complete()
+
+    def debug_log(self, message):
+        self.debug_lines.append(message)
+
+    def shell_log(self, message):
+        self.shell_chars += len(message)
+
+    def set_status(self, name, state):
+        pass
+
+    def confirm_execution(self, commands, streamed):
+        return True
+
+    def play_sound(self, file_name):
+        self.playback_done.set()
+
+    def play_stream(self, chunks, sample_rate):
+        for _ in chunks:
+            pass
+        self.playback_done.set()
+
+    def start(self):
+        # the benchmark runs the turns itself
+        pass
+
+#-------------------------------------------------------
+# Scenarios
+#-------------------------------------------------------
+
+ANSWER = ("Your home folder contains the usual folders Documents, Downloads, Music and Pictures, "
+          "plus 40 text files that were created today. Nothing looks unusual.")
+
+def reply_for(scenario):
+    """Return the mock chat reply function of a scenario."""
+    def reply(messages):
+        last = messages[-1]
+        # summary requests of the context manager
+        if messages[0]["content"] == Autoshell.ContextManager.SUMMARY_PROMPT:
+            return "The user asked about the files in the home folder several times."
+        if scenario == "shell" and last["role"] == "user":
+            return json.dumps({"target": "shell", "content": "Get-ChildItem ~"})
+        # the turn number keeps the answers different, same answers reset the history
+        turn = sum(1 for message in messages if message["role"] == "user")
+        return json.dumps({"target": "user", "content": f"{ANSWER} (turn {turn})"})
+    return reply
+
+def run_turn(scenario, index):
+    """One run of the request pipeline, errors are shown as SYSTEM ERROR like in the window."""
+    gui = Autoshell.gui_handler
+    gui.playback_done.clear()
+    if scenario == "voice":
+        # one second of silence, as if it had just been recorded
+        Autoshell.pipeline.run(recording=([], bytes(Autoshell.SOUND_SAMPLE_RATE * 2)))
+    else:
+        Autoshell.pipeline.run(f"What is in my home folder? ({index})")
+    # text-to-speech runs on its own thread, the turn is over once it was played
+    if Autoshell.prompt_handler.speech_output_enabled:
+        gui.playback_done.wait(30)
+
+def run_scenario(server, scenario, turns, measure_allocations):
+    server.reply = reply_for(scenario)
+    Autoshell.prompt_handler.speech_output_enabled = scenario == "voice"
+    Autoshell.prompt_handler.chat_history = Autoshell.PromptHandler.reset_chat_history(Autoshell.gui_handler)
+    requests_before = server.requests
+    errors_before = len(Autoshell.gui_handler.errors)
+
+    latencies = []
+    allocated = []
+    peaks = []
+    start = time.perf_counter()
+    for index in range(turns):
+        if measure_allocations:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        t = time.perf_counter()
+        run_turn(scenario, index)
+        latencies.append(time.perf_counter() - t)
+        if measure_allocations:
+            current, peak = tracemalloc.get_traced_memory()
+            allocated.append(current - before)
+            peaks.append(peak - before)
+    total = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        "scenario": scenario,
+        "turns": turns,
+        "latency_mean": statistics.mean(latencies),
+        "latency_p50": latencies[len(latencies) // 2],
+        "latency_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "throughput": turns / total,
+        "api_requests_per_turn": (server.requests - requests_before) / turns,
+        "errors": len(Autoshell.gui_handler.errors) - errors_before,
+    }
+    if measure_allocations:
+        result["retained_bytes_per_turn"] = statistics.mean(allocated)
+        result["peak_bytes_per_turn"] = statistics.mean(peaks)
+    return result
+
+#-------------------------------------------------------
+# Setup
+#-------------------------------------------------------
+
+def setup(root_path, args):
+    """Create the globals that Autoshell.main would create, wired to the stand-ins."""
+    repository_files = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files")
+    shutil.copytree(repository_files, os.path.join(root_path, "files"),
+                    ignore=shutil.ignore_patterns("*.mp3", "*.wav"))
+
+    fake_shell = os.path.join(root_path, "fake_powershell")
+    with open(fake_shell, "w", encoding="utf-8") as f:
+        f.write(FAKE_SHELL.replace("#!/usr/bin/env python3", f"#!{sys.executable}", 1))
+    os.chmod(fake_shell, 0o755)
+    os.environ["FAKE_SHELL_LINES"] = str(args.shell_lines)
+    os.environ["FAKE_SHELL_DELAY"] = str(args.shell_delay)
+
+    server = MockOpenAiServer(args.latency, args.token_latency, args.chunk_chars)
+    server.start()
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+
+    Autoshell.gui_handler = BenchGui(root_path, args.model)
+    # the temporary folder is gone at exit, the trace is only written with --trace
+    Autoshell.tracer = Autoshell.Tracer(None)
+    Autoshell.startup_handler = Autoshell.StartupHandler(Autoshell.gui_handler)
+    Autoshell.session_journal = Autoshell.SessionJournal(Autoshell.gui_handler.log_path)
+    Autoshell.sound_handler = Autoshell.SoundHandler(Autoshell.gui_handler)
+    Autoshell.tts_cache = Autoshell.TtsCache(os.path.join(root_path, "cache", "tts"))
+    Autoshell.pipeline = Autoshell.Pipeline(Autoshell.gui_handler)
+
+    # without network tiktoken can't download its encodings, then tokens are estimated from words
+    try:
+        Autoshell.PromptHandler.encoding_for_model(args.model)
+    except Exception as e:
+        print(f"Tokenizer not available ({e.__class__.__name__}), token counts are estimated")
+        Autoshell.PromptHandler.encoding_for_model = staticmethod(lambda model: WordEncoding())
+
+    Autoshell.prompt_handler = Autoshell.PromptHandler(Autoshell.gui_handler)
+    Autoshell.prompt_handler.ask_for_execution = False
+
+    def start_powershell():
+        Autoshell.shell_pool = Autoshell.ShellPool(Autoshell.gui_handler, args.pool_size, fake_shell)
+
+    def start_openai():
+        Autoshell.openai_handler = Autoshell.OpenAiHandler()
+
+    Autoshell.startup_handler.start("PowerShell", start_powershell)
+    Autoshell.startup_handler.start("OpenAI", start_openai)
+    Autoshell.startup_handler.mark("ui shown")
+    Autoshell.startup_handler.wait("PowerShell")
+    Autoshell.startup_handler.wait("OpenAI")
+    return server
+
+
+class WordEncoding:
+    """Rough stand-in for a tiktoken encoding, one token per word or symbol."""
+
+    def encode(self, text, disallowed_special=()):
+        return re.findall(r"\w+|\S", text)
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+#-------------------------------------------------------
+# Main
+#-------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless end-to-end benchmark of the Autoshell pipeline.")
+    parser.add_argument("--turns", type=int, default=20, help="pipeline runs per scenario")
+    parser.add_argument("--scenarios", default="text,shell,voice", help="comma separated: text, shell, voice")
+    parser.add_argument("--model", default=Autoshell.LARGE_LANGUAGE_MODEL)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds until the mock api answers")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="seconds between streamed chunks")
+    parser.add_argument("--chunk-chars", type=int, default=4, help="characters per streamed chunk")
+    parser.add_argument("--shell-lines", type=int, default=40, help="output lines of every fake shell command")
+    parser.add_argument("--shell-delay", type=float, default=0.01, help="seconds every fake shell command takes")
+    parser.add_argument("--pool-size", type=int, default=Autoshell.SHELL_POOL_SIZE)
+    parser.add_argument("--no-allocations", action="store_true", help="don't trace allocations (tracemalloc slows down python)")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--trace", help="write the spans of all runs as chrome trace to this file")
+    args = parser.parse_args()
+
+    root_path = tempfile.mkdtemp(prefix="autoshell_benchmark_")
+    try:
+        server = setup(root_path, args)
+        if not args.no_allocations:
+            tracemalloc.start()
+        results = [run_scenario(server, scenario.strip(), args.turns, not args.no_allocations)
+                   for scenario in args.scenarios.split(",")]
+        if not args.no_allocations:
+            tracemalloc.stop()
+
+        print(f"\n{'scenario':<8} {'turns':>5} {'mean':>8} {'p50':>8} {'p95':>8} {'turns/s':>8} {'api/turn':>8} {'kB kept':>8} {'kB peak':>8}")
+        for r in results:
+            kept = f"{r['retained_bytes_per_turn'] / 1024:8.1f}" if "retained_bytes_per_turn" in r else f"{'-':>8}"
+            peak = f"{r['peak_bytes_per_turn'] / 1024:8.1f}" if "peak_bytes_per_turn" in r else f"{'-':>8}"
+            print(f"{r['scenario']:<8} {r['turns']:>5} {r['latency_mean']:8.3f} {r['latency_p50']:8.3f} "
+                  f"{r['latency_p95']:8.3f} {r['throughput']:8.2f} {r['api_requests_per_turn']:8.1f} {kept} {peak}")
+        print(f"\nLatency per stage:\n{Autoshell.tracer.summary()}")
+        if Autoshell.gui_handler.errors:
+            print(f"\n{len(Autoshell.gui_handler.errors)} turns failed, first error: {Autoshell.gui_handler.errors[0]}")
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump({"arguments": vars(args), "results": results}, f, indent=2)
+        if args.trace:
+            Autoshell.tracer.export(args.trace)
+        server.shutdown()
+        Autoshell.shell_pool.primary.shell_process.kill()
+        for worker in Autoshell.shell_pool.workers:
+            worker.shell_process.kill()
+    finally:
+        Autoshell.session_journal.close()
+        shutil.rmtree(root_path, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
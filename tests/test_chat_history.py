@@ -0,0 +1,49 @@
+import pytest
+
+import Autoshell
+
+
+class CharEncoding:
+    """Stand-in for a tiktoken encoding, one token per character."""
+
+    def encode(self, text, disallowed_special=()):
+        return list(text)
+
+
+@pytest.fixture(autouse=True)
+def char_encoding(monkeypatch):
+    monkeypatch.setattr(Autoshell.PromptHandler, "encoding_for_model", staticmethod(lambda model: CharEncoding()))
+
+
+def message(content, role="user"):
+    return {"role": role, "content": content}
+
+
+def fresh_count(history):
+    return Autoshell.ChatHistory(list(history)).token_count("model")
+
+
+def test_append_is_counted():
+    history = Autoshell.ChatHistory([message("hello")])
+    history.token_count("model")
+    history.append(message("more text"))
+    assert history.token_count("model") == fresh_count(history)
+
+
+@pytest.mark.parametrize("change", [
+    lambda history: history.__setitem__(1, message("a much longer replacement")),
+    lambda history: history.__setitem__(slice(0, 2), [message("x")]),
+    lambda history: history.__delitem__(0),
+    lambda history: history.insert(1, message("inserted")),
+    lambda history: history.pop(),
+    lambda history: history.remove(history[0]),
+    lambda history: history.extend([message("one"), message("two")]),
+    lambda history: history.__iadd__([message("three")]),
+    lambda history: history.clear(),
+    lambda history: history.replace_range(0, 2, [message("summary", "system")]),
+])
+def test_every_change_keeps_the_total_right(change):
+    history = Autoshell.ChatHistory([message("first"), message("second message"), message("third")])
+    history.token_count("model")
+    change(history)
+    assert history.token_count("model") == fresh_count(history)
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+import Autoshell
+
+
+@pytest.fixture
+def classifier():
+    return Autoshell.ForwardingClassifier(Autoshell.TerminalUi())
+
+
+@pytest.mark.parametrize("message", [
+    "Use the -Force flag to overwrite the file.",
+    "Where do you want to save it?",
+    "Start by opening the folder.",
+])
+def test_prose_is_for_the_user(classifier, message):
+    assert classifier.classify(message) == ("user", 1.0)
+
+
+def test_prose_about_a_cmdlet_is_not_executed(classifier):
+    answer_type, confidence = classifier.classify("Remove-Item deletes files. Should I proceed?")
+    assert answer_type == "user" or confidence < Autoshell.FORWARDING_CLASSIFIER_THRESHOLD
+
+
+@pytest.mark.parametrize("message", [
+    "Get-ChildItem -Force",
+    "Stop-Process -Name notepad -Force",
+    "Get-Process | Sort-Object CPU -Descending",
+    "ping -n 4 example.com",
+    "if ($x) { Get-Date }",
+])
+def test_commands_are_for_the_shell(classifier, message):
+    answer_type, confidence = classifier.classify(message)
+    assert answer_type == "shell"
+    assert confidence >= Autoshell.FORWARDING_CLASSIFIER_THRESHOLD
+
+
+@pytest.mark.parametrize("message", ["Help me", "Start now", "where is it", "git status"])
+def test_known_command_without_syntax_asks_the_model(classifier, message):
+    _, confidence = classifier.classify(message)
+    assert confidence < Autoshell.FORWARDING_CLASSIFIER_THRESHOLD
+
+
+@pytest.mark.parametrize("message", ["ipconfig /all", "dir C:\\Users", "cd ~", "notepad notes.txt"])
+def test_known_command_with_syntax_is_for_the_shell(classifier, message):
+    answer_type, confidence = classifier.classify(message)
+    assert answer_type == "shell"
+    assert confidence >= Autoshell.FORWARDING_CLASSIFIER_THRESHOLD
+
+
+def test_stale_known_commands_are_queried_again(classifier, tmp_path):
+    cache_file = tmp_path / "known_commands.txt"
+    cache_file.write_text("Old-Command")
+    stale = cache_file.stat().st_mtime - Autoshell.KNOWN_COMMANDS_MAX_AGE - 1
+    os.utime(cache_file, (stale, stale))
+
+    class Shell:
+        def list_known_commands(self):
+            return ["New-Command"]
+
+    classifier.load_known_commands(str(cache_file), Shell())
+    assert "new-command" in classifier.known_commands
+    assert "old-command" not in classifier.known_commands
+    assert cache_file.read_text() == "New-Command"
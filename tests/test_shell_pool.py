@@ -0,0 +1,21 @@
+import pytest
+
+import Autoshell
+
+
+def test_independent_queries_are_split():
+    block = "Get-Process | Sort-Object CPU | Out-String\nGet-Service\nipconfig /all"
+    assert Autoshell.ShellPool.split_independent(block) == block.splitlines()
+
+
+@pytest.mark.parametrize("block", [
+    "Get-Process | Out-File C:\\tmp\\a.txt\nGet-Content C:\\tmp\\a.txt",
+    "Get-ChildItem (Remove-Item x)\nGet-Process",
+    "Get-Item @(New-Item a)\nGet-Process",
+    "Get-Process\n& Remove-Item x",
+    "Get-Process\n. .\\script.ps1",
+    "Set-Location C:\\\nGet-ChildItem",
+    "$x = Get-Process\nGet-Service",
+])
+def test_dependent_or_writing_blocks_stay_together(block):
+    assert Autoshell.ShellPool.split_independent(block) == [block]
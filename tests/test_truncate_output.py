@@ -0,0 +1,69 @@
+import Autoshell
+
+
+class ChunkEncoding:
+    """Lossless stand-in for a tiktoken encoding, one token per 4 characters. It remembers the
+    longest text it was asked to encode."""
+
+    def __init__(self):
+        self.longest = 0
+
+    def encode(self, text, disallowed_special=()):
+        self.longest = max(self.longest, len(text))
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def truncate(output_lines, max_tokens=1000):
+    encoding = ChunkEncoding()
+    text, elided_lines = Autoshell.ShellHandler.truncate_output(output_lines, max_tokens, encoding)
+    return text, elided_lines, encoding
+
+
+def test_short_output_is_unchanged():
+    lines = [f"line {i}\n" for i in range(10)]
+    text, elided_lines, _ = truncate(lines)
+    assert text == "".join(lines)
+    assert elided_lines == 0
+
+
+def test_many_lines_keep_head_and_tail():
+    lines = [f"line {i}\n" for i in range(5000)]
+    text, elided_lines, encoding = truncate(lines)
+    assert len(encoding.encode(text)) <= 1000
+    assert text.startswith("line 0\n")
+    assert text.endswith("line 4999\n")
+    assert elided_lines > 0
+
+
+def test_one_huge_line_is_never_encoded_completely():
+    line = "x" * 6_000_000
+    text, elided_lines, encoding = truncate([line])
+    assert encoding.longest < 100_000
+    assert len(ChunkEncoding().encode(text)) <= 1000
+    assert elided_lines == 1
+
+
+def test_one_long_line_keeps_its_start_and_end():
+    line = "a" * 3000 + "z" * 3000
+    text, _, _ = truncate([line])
+    assert len(ChunkEncoding().encode(text)) <= 1000
+    assert text.startswith("aaaa")
+    assert text.endswith("zzzz")
+    assert len(text) > 3000
+
+
+def test_error_after_a_huge_line_is_kept():
+    lines = ["x" * 6_000_000 + "\n", "ERROR: disk full\n"]
+    text, _, encoding = truncate(lines)
+    assert encoding.longest < 100_000
+    assert len(ChunkEncoding().encode(text)) <= 1000
+    assert text.endswith("ERROR: disk full\n")
+
+
+def test_tiny_budget_is_not_exceeded():
+    lines = [f"line {i}\n" for i in range(1000)]
+    text, _, _ = truncate(lines, max_tokens=5)
+    assert len(ChunkEncoding().encode(text)) <= 5